@@ -0,0 +1,351 @@
+"""
+The images, fonts and sounds used by the game. Each asset is loaded the
+first time it is used, so importing the game has no side effects. Images
+are converted to the pixel format of the display once the window exists,
+so that blitting them needs no conversion.
+
+If the bundle built by build_bundle.py exists, assets are loaded from it
+rather than from their own files. The bundle is mapped into memory, with
+the sprites packed into one atlas image and the sound effects already
+decoded, so the game opens one file instead of dozens.
+"""
+import io
+import json
+import mmap
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+
+# Paths to assets
+ASSETS_PATH = "assets"
+IMAGES_PATH = os.path.join(ASSETS_PATH, "images")
+AUDIO_PATH = os.path.join(ASSETS_PATH, "audio")
+FONTS_PATH = os.path.join(ASSETS_PATH, "fonts")
+
+# Image files by name.
+IMAGE_FILES = {
+    "player_standing": "player_standing.png",
+    "player_firing": "player_firing.png",
+    "player_left_0": "player_left_0.png",
+    "player_left_1": "player_left_1.png",
+    "player_left_2": "player_left_2.png",
+    "player_left_3": "player_left_3.png",
+    "player_life": "player_life.png",
+    "arrow_head": "arrow_head.png",
+    "arrow_tail": "arrow_tail.png",
+    "balloon_1": "balloon_1.png",
+    "balloon_2": "balloon_2.png",
+    "balloon_3": "balloon_3.png",
+    "balloon_4": "balloon_4.png",
+    "balloon_5": "balloon_5.png",
+    "balloon_freeze": "balloon_1_freeze.png",
+    "balloon_star": "balloon_star.png",
+    "balloon_clock": "balloon_clock.png",
+}
+# Background image for each level.
+for i in range(1, 11):
+    IMAGE_FILES[f"background_{i}"] = f"background_{i}.jpg"
+
+# Font files by name.
+FONT_FILES = {
+    "regular": "BitcountPropSingle-Regular.ttf",
+    "bold": "BitcountPropSingle-Bold.ttf",
+}
+
+# Sound files by name.
+SOUND_FILES = {
+    "pop": "pop.ogg",
+    "fire": "fire.ogg",
+    "ow": "ow.ogg",
+    "level": "level.ogg",
+    "applause": "applause.ogg",
+}
+MUSIC_FILE = "theme.ogg"
+
+# The bundle file: a header, the manifest as JSON, then the data of every
+# asset. The manifest gives the offset and length of each one in the data,
+# which starts at the first multiple of BUNDLE_ALIGN after the manifest.
+BUNDLE_FILE = os.path.join(ASSETS_PATH, "bundle.bin")
+BUNDLE_MAGIC = b"SPAB"
+BUNDLE_VERSION = 1
+BUNDLE_HEADER = struct.Struct("<4sHI") # Magic, version and manifest length.
+BUNDLE_ALIGN = 16
+
+# The prepared images by name.
+IMAGES = {}
+# Fonts by name and size.
+FONTS = {}
+# Sounds by name.
+SOUNDS = {}
+# Collision masks by image name and whether the image is flipped.
+MASKS = {}
+# The open bundle, by path, or None if there is no bundle.
+BUNDLES = {}
+BUNDLE_LOCK = threading.Lock()
+
+def load_image(name):
+    """
+    Load the named image and keep it for later use.
+    """
+    surface = read_image(name)
+    IMAGES[name] = surface
+    return surface
+
+def read_image(name):
+    """
+    Return the named image, converted if the window exists, without keeping
+    it. This is safe to call from any thread.
+    """
+    b = bundle()
+    if b is not None and (b.has("sprites", name) or b.has("images", name)):
+        return b.image(name)
+    surface = pygame.image.load(os.path.join(IMAGES_PATH, IMAGE_FILES[name]))
+    if pygame.display.get_surface() is not None:
+        surface = convert(surface)
+    return surface
+
+def convert_images():
+    """
+    Convert every loaded image to the pixel format of the display. This can
+    only be done once the display mode has been set.
+    """
+    b = bundle()
+    if b is not None:
+        b.convert()
+    for name, surface in IMAGES.items():
+        if b is not None and b.has("sprites", name):
+            IMAGES[name] = b.sprite(name)
+        else:
+            IMAGES[name] = convert(surface)
+
+def convert(surface):
+    """
+    Return a copy of surface in the pixel format of the display, keeping
+    per-pixel alpha if it has it.
+    """
+    if surface.get_flags() & pygame.SRCALPHA:
+        return surface.convert_alpha()
+    return surface.convert()
+
+def image(name):
+    """
+    Return the prepared image with the given name, loading it if this is
+    the first time it has been used.
+    """
+    surface = IMAGES.get(name)
+    if surface is None:
+        surface = load_image(name)
+    return surface
+
+def mask(name, flip_x=False):
+    """
+    Return the collision mask of the named image, flipped horizontally if
+    flip_x is True. Each mask is only made once.
+    """
+    key = (name, flip_x)
+    m = MASKS.get(key)
+    if m is None:
+        surface = image(name)
+        if flip_x:
+            surface = pygame.transform.flip(surface, flip_x=True, flip_y=False)
+        m = pygame.mask.from_surface(surface)
+        MASKS[key] = m
+    return m
+
+def font(name, size):
+    """
+    Return the named font in the given size. The font module must have
+    been initialised.
+    """
+    key = (name, size)
+    f = FONTS.get(key)
+    if f is None:
+        b = bundle()
+        if b is not None and b.has("fonts", name):
+            f = b.font(name, size)
+        else:
+            f = pygame.font.Font(os.path.join(FONTS_PATH, FONT_FILES[name]), size)
+        FONTS[key] = f
+    return f
+
+def sound(name):
+    """
+    Return the named sound effect. The mixer must have been initialised.
+    """
+    s = SOUNDS.get(name)
+    if s is None:
+        b = bundle()
+        if b is not None and b.has("sounds", name):
+            s = b.sound(name)
+        else:
+            s = pygame.mixer.Sound(os.path.join(AUDIO_PATH, SOUND_FILES[name]))
+        SOUNDS[name] = s
+    return s
+
+def load_music():
+    """
+    Load the background music, ready to play.
+    """
+    pygame.mixer.music.load(os.path.join(AUDIO_PATH, MUSIC_FILE))
+
+def bundle(path=BUNDLE_FILE):
+    """
+    Return the bundle at path, opening it the first time, or None if there
+    is no bundle there.
+    """
+    with BUNDLE_LOCK:
+        if path not in BUNDLES:
+            BUNDLES[path] = Bundle(path) if os.path.exists(path) else None
+        return BUNDLES[path]
+
+def bundle_data_start(manifest_length):
+    """
+    Return where the data of a bundle starts, given the length of its
+    manifest.
+    """
+    end = BUNDLE_HEADER.size + manifest_length
+    return -(-end // BUNDLE_ALIGN) * BUNDLE_ALIGN
+
+class Bundle:
+    """
+    The assets packed into one file and mapped into memory. The sprites are
+    areas of a single atlas image, and each other asset is a slice of the
+    file that is read without copying it.
+    """
+    def __init__(self, path):
+        """
+        Open the bundle at path and read its manifest.
+        """
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = BUNDLE_HEADER.unpack_from(self.data)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise ValueError(f"{path} is not a version {BUNDLE_VERSION} asset bundle")
+        start = BUNDLE_HEADER.size
+        self.manifest = json.loads(self.data[start:start + length])
+        self.base = bundle_data_start(length)
+        self.atlas = None # The atlas image, once it has been used.
+        self.sprites = {} # Sprites cut from the atlas, by name.
+        # The mixer format the sounds were decoded for.
+        self.mixer = tuple(self.manifest["mixer"])
+
+    def view(self, entry):
+        """
+        Return the bytes of the asset with the given offset and length.
+        """
+        offset, length = entry[0] + self.base, entry[1]
+        return memoryview(self.data)[offset:offset + length]
+
+    def has(self, kind, name):
+        """
+        Return True if the bundle holds the named asset of a kind: "sprites",
+        "images" for the other images, "fonts" or "sounds". Sounds can only
+        be used if they were decoded for the mixer's format.
+        """
+        if kind == "sounds" and pygame.mixer.get_init() != self.mixer:
+            return False
+        return name in self.manifest[kind]
+
+    def sprite(self, name):
+        """
+        Return the named sprite image, an area of the atlas.
+        """
+        surface = self.sprites.get(name)
+        if surface is None:
+            if self.atlas is None:
+                self.atlas = pygame.image.frombuffer(self.view(self.manifest["atlas"]),
+                                                     self.manifest["atlas_size"], "RGBA")
+                if pygame.display.get_surface() is not None:
+                    self.atlas = self.atlas.convert_alpha()
+            surface = self.atlas.subsurface(self.manifest["sprites"][name])
+            self.sprites[name] = surface
+        return surface
+
+    def image(self, name):
+        """
+        Return the named image, from the atlas if it is a sprite and
+        otherwise decoded from the bundle.
+        """
+        if self.has("sprites", name):
+            return self.sprite(name)
+        offset, length, ext = self.manifest["images"][name]
+        surface = pygame.image.load(io.BytesIO(self.view((offset, length))), ext)
+        if pygame.display.get_surface() is not None:
+            surface = convert(surface)
+        return surface
+
+    def font(self, name, size):
+        """
+        Return the named font in the given size.
+        """
+        return pygame.font.Font(io.BytesIO(self.view(self.manifest["fonts"][name])), size)
+
+    def sound(self, name):
+        """
+        Return the named sound effect, from samples in the mixer's format.
+        """
+        return pygame.mixer.Sound(buffer=self.view(self.manifest["sounds"][name]))
+
+    def convert(self):
+        """
+        Convert the atlas to the pixel format of the display, cutting the
+        sprites from it again.
+        """
+        if self.atlas is not None:
+            self.atlas = self.atlas.convert_alpha()
+            self.sprites = {}
+
+class Backgrounds:
+    """
+    The background images of the levels. Only the backgrounds of the
+    current and next levels are kept in memory, and the next one is loaded
+    on a worker thread while the current level is played.
+    """
+    def __init__(self):
+        """
+        Create the backgrounds, with none loaded yet.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backgrounds")
+        self.loading = {} # The image for each resident level, as a Future.
+        self.level = None # The level of the last background returned.
+        self.current = None # The background of that level.
+
+    def image(self, level):
+        """
+        Return the background for a level. When the level changes, the
+        backgrounds of other levels are released and the next one is loaded
+        in the background.
+        """
+        if level != self.level:
+            future = self.loading.get(level) or self.load(level)
+            # Only waits if the level was reached before its background loaded.
+            self.current = future.result()
+            self.level = level
+            self.loading = {level: future}
+            if f"background_{level + 1}" in IMAGE_FILES:
+                self.loading[level + 1] = self.load(level + 1)
+        return self.current
+
+    def prefetch(self, level):
+        """
+        Start loading the background of a level that will be needed soon.
+        """
+        if level not in self.loading:
+            self.loading[level] = self.load(level)
+
+    def load(self, level):
+        """
+        Start loading the background of a level, returning a Future.
+        """
+        return self.executor.submit(read_image, f"background_{level}")
+
+    def close(self):
+        """
+        Stop the worker thread and release the backgrounds.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.loading = {}
+        self.current = None
+        self.level = None
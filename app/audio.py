@@ -0,0 +1,100 @@
+"""
+Sound effects. The mixer is set up with a small buffer so that effects are
+heard as soon as they are played, and each effect has its own channels so
+that a burst of one effect cannot drown out another. Effects cued during a
+frame are played together when the frame ends, each no more than once.
+"""
+import pygame
+import assets
+from simulation import SOUND_POP, SOUND_FIRE, SOUND_OW, SOUND_LEVEL
+
+# Mixer settings. The buffer is in samples, about 12ms at this frequency.
+MIXER_FREQUENCY = 44100
+MIXER_SIZE = -16
+MIXER_CHANNELS = 2
+MIXER_BUFFER = 512
+
+# The sound effect for each sound cue emitted by the simulation.
+SOUND_EFFECTS = {SOUND_POP: "pop",
+                 SOUND_FIRE: "fire",
+                 SOUND_OW: "ow",
+                 SOUND_LEVEL: "level"}
+
+# The number of channels reserved for each sound effect. When they are all
+# busy, the effect that has been playing longest is cut off.
+EFFECT_CHANNELS = {"pop": 4,
+                   "fire": 2,
+                   "ow": 1,
+                   "level": 1,
+                   "applause": 1}
+
+def pre_init():
+    """
+    Choose the mixer settings. This must be called before pygame.init().
+    """
+    pygame.mixer.pre_init(MIXER_FREQUENCY, MIXER_SIZE, MIXER_CHANNELS, MIXER_BUFFER)
+
+class SoundManager:
+    """
+    Plays the sound effects on their reserved channels.
+    """
+    def __init__(self):
+        """
+        Reserve the channels for each effect. If there is no mixer, for
+        instance because there is no audio device, nothing is played.
+        """
+        self.enabled = pygame.mixer.get_init() is not None
+        # The channels of each effect, from the one that started playing
+        # longest ago to the most recent.
+        self.channels = {}
+        self.cued = [] # Effects to play at the end of the frame, in order.
+        if not self.enabled:
+            return
+        total = sum(EFFECT_CHANNELS.values())
+        pygame.mixer.set_num_channels(total)
+        # Keep the channels from being chosen by Sound.play.
+        pygame.mixer.set_reserved(total)
+        first = 0
+        for name, count in EFFECT_CHANNELS.items():
+            self.channels[name] = [pygame.mixer.Channel(i) for i in range(first, first + count)]
+            first += count
+
+    def cue(self, name):
+        """
+        Play an effect at the end of the frame. An effect cued several times
+        in a frame is only played once.
+        """
+        if name not in self.cued:
+            self.cued.append(name)
+
+    def cue_all(self, cues):
+        """
+        Cue the effects for sound cues emitted by the simulation.
+        """
+        for cue in cues:
+            self.cue(SOUND_EFFECTS[cue])
+
+    def flush(self):
+        """
+        Play the effects cued during the frame.
+        """
+        for name in self.cued:
+            self.play(name)
+        self.cued.clear()
+
+    def play(self, name):
+        """
+        Play an effect now, on a free channel of its own if there is one and
+        otherwise on the one that started playing longest ago.
+        """
+        if not self.enabled:
+            return
+        channels = self.channels[name]
+        channel = channels[0]
+        for c in channels:
+            if not c.get_busy():
+                channel = c
+                break
+        channels.remove(channel)
+        channels.append(channel)
+        channel.play(assets.sound(name))
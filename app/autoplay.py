@@ -0,0 +1,117 @@
+"""
+A bot that plays the game. On every tick it predicts where the balloons
+are going, dodges any that would hit the player soon, moves towards the
+nearest balloon it can shoot and fires when a balloon is about to cross
+the column an arrow would fill. It only uses the same inputs as a person
+playing, so it can drive soak tests and demonstrations of the game:
+
+    $ python app/autoplay.py 10
+"""
+import sys
+import time
+import numpy as np
+from predictor import Predictor, first_tick
+from simulation import Simulation, Inputs, NO_INPUT
+
+# How far ahead the bot looks for balloons that would hit the player, in ticks.
+DANGER_TICKS = 24
+# The bot gives up on its target to dodge a balloon that would hit the
+# player within this many ticks.
+DODGE_TICKS = 12
+# Roughly how long an arrow takes to reach the top of the stage, in ticks.
+# The bot fires when a balloon will cross the arrow's column in that time.
+ARROW_TICKS = 10
+# How far the player moves on each tick.
+PLAYER_STEP = 8
+
+class AutoPlayer:
+    """
+    Chooses the inputs for each tick of a game.
+    """
+    def __init__(self, danger_ticks=DANGER_TICKS, dodge_ticks=DODGE_TICKS):
+        """
+        Create a bot that looks danger_ticks ahead and dodges balloons that
+        would hit it within dodge_ticks.
+        """
+        self.danger_ticks = danger_ticks
+        self.dodge_ticks = dodge_ticks
+        self.horizon = max(danger_ticks, ARROW_TICKS)
+
+    def inputs(self, sim):
+        """
+        Return the inputs for the next tick of sim.
+        """
+        predictor = Predictor.of(sim)
+        if len(predictor) == 0:
+            return NO_INPUT
+        player = sim.player.rect
+        left, top, right, bottom = predictor.track(self.horizon)
+        # The first tick on which the player would be hit if it stood still
+        # or kept moving left or right, or horizon + 1 if it would not be.
+        safe = {move: self.time_to_hit(sim, move, left[:self.danger_ticks],
+                                       top[:self.danger_ticks], right[:self.danger_ticks],
+                                       bottom[:self.danger_ticks])
+                for move in (0, -1, 1)}
+        # Balloons that are waiting at the top can't be popped yet.
+        targets = ~sim.balloon_store.waiting[predictor.slots]
+        column = player.centerx
+        crossing = first_tick((left[:ARROW_TICKS] <= column) & (right[:ARROW_TICKS] > column)
+                              & targets)
+        fire = len(sim.arrows) == 0 and bool((crossing > 0).any())
+        move = 0
+        if targets.any():
+            # Head for where the nearest balloon will be when an arrow
+            # could reach it.
+            centres = (left[ARROW_TICKS - 1] + right[ARROW_TICKS - 1]) / 2
+            distance = np.where(targets, centres - column, np.inf)
+            nearest = distance[np.argmin(np.abs(distance))]
+            if abs(nearest) > PLAYER_STEP:
+                move = 1 if nearest > 0 else -1
+        if safe[move] <= self.dodge_ticks:
+            # Dodge whichever way keeps the player safe longest, standing
+            # still if that is as good as moving.
+            move = max((0, -1, 1), key=lambda m: safe[m])
+        return Inputs(left=move < 0, right=move > 0, fire=fire)
+
+    def time_to_hit(self, sim, move, left, top, right, bottom):
+        """
+        Return the first tick on which a balloon, with the given edges on
+        each tick, would hit the player if it kept moving in the direction
+        move, or one more than the number of ticks if none would.
+        """
+        player = sim.player
+        rect = player.rect
+        ticks = np.arange(1, len(left) + 1)
+        if move < 0:
+            # The player moves while its left edge is right of min_x.
+            steps = max(0, -(-(rect.left - player.min_x) // PLAYER_STEP))
+            x = rect.left - PLAYER_STEP * np.minimum(ticks, steps)
+        elif move > 0:
+            steps = max(0, -(-(player.max_x - rect.right) // PLAYER_STEP))
+            x = rect.left + PLAYER_STEP * np.minimum(ticks, steps)
+        else:
+            x = np.full(len(ticks), rect.left)
+        x = x[:, None]
+        hits = ((left < x + rect.width) & (right > x) &
+                (top < rect.bottom) & (bottom > rect.top)).any(axis=1)
+        return int(np.argmax(hits)) + 1 if hits.any() else len(ticks) + 1
+
+def play(sim, bot=None, max_ticks=None):
+    """
+    Let the bot play sim until the game ends or has run for max_ticks, and
+    return sim.
+    """
+    bot = bot or AutoPlayer()
+    while sim.playing and (max_ticks is None or sim.tick < max_ticks):
+        sim.step(bot.inputs(sim))
+    return sim
+
+if __name__ == '__main__':
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    for seed in range(games):
+        start = time.perf_counter()
+        sim = play(Simulation(seed=seed))
+        elapsed = time.perf_counter() - start
+        outcome = "won" if sim.won else "game over"
+        print(f"seed {seed}: {outcome} on level {sim.level} with {sim.lives} lives, "
+              f"{sim.popped_count} popped in {sim.tick} ticks ({elapsed:.1f}s)")
@@ -0,0 +1,123 @@
+"""
+Build the asset bundle. The sprites are packed into one atlas image, and
+the atlas, backgrounds, fonts and decoded sound effects are written to a
+single file that the game maps into memory instead of opening every asset
+on its own. Run it from the root of the repository, and again whenever an
+asset changes:
+
+    $ python app/build_bundle.py
+"""
+import json
+import os
+import sys
+import time
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import pygame
+import assets
+import audio
+
+# The width of the atlas. Its height is whatever the sprites need.
+ATLAS_WIDTH = 256
+# Space left around each sprite in the atlas.
+PADDING = 1
+
+def pack(sizes, width=ATLAS_WIDTH):
+    """
+    Place rectangles of the given sizes, by name, in rows across an area of
+    the given width, tallest first. Return the position of each one and the
+    height of the area.
+    """
+    positions = {}
+    x, y, row_height = 0, 0, 0
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], item[0])):
+        if x + w > width:
+            # Start a new row.
+            x, y, row_height = 0, y + row_height + PADDING, 0
+        positions[name] = (x, y)
+        x += w + PADDING
+        row_height = max(row_height, h)
+    return positions, y + row_height
+
+def build_atlas(names):
+    """
+    Pack the named images into one image, and return it with the area of
+    each image in it.
+    """
+    images = {name: pygame.image.load(os.path.join(assets.IMAGES_PATH, assets.IMAGE_FILES[name]))
+              for name in names}
+    positions, height = pack({name: image.get_size() for name, image in images.items()})
+    atlas = pygame.Surface((ATLAS_WIDTH, height), pygame.SRCALPHA, 32)
+    atlas.fill((0, 0, 0, 0))
+    areas = {}
+    for name, image in images.items():
+        atlas.blit(image, positions[name])
+        areas[name] = positions[name] + image.get_size()
+    return atlas, areas
+
+def read_file(path):
+    """
+    Return the contents of a file.
+    """
+    with open(path, "rb") as f:
+        return f.read()
+
+def build(path=assets.BUNDLE_FILE):
+    """
+    Build the bundle and write it to path, returning its size in bytes.
+    """
+    blobs = []
+    offset = 0
+    def add(data):
+        # Add data to the bundle and return its offset and length.
+        nonlocal offset
+        entry = [offset, len(data)]
+        blobs.append(data)
+        padding = -len(data) % assets.BUNDLE_ALIGN
+        blobs.append(bytes(padding))
+        offset += len(data) + padding
+        return entry
+
+    sprites = [name for name, file in assets.IMAGE_FILES.items() if file.endswith(".png")]
+    atlas, areas = build_atlas(sprites)
+    manifest = {"atlas": add(pygame.image.tobytes(atlas, "RGBA")),
+                "atlas_size": atlas.get_size(),
+                "sprites": areas,
+                "images": {},
+                "fonts": {},
+                "sounds": {}}
+    for name, file in assets.IMAGE_FILES.items():
+        if name not in areas:
+            data = read_file(os.path.join(assets.IMAGES_PATH, file))
+            manifest["images"][name] = add(data) + [os.path.splitext(file)[1][1:]]
+    for name, file in assets.FONT_FILES.items():
+        manifest["fonts"][name] = add(read_file(os.path.join(assets.FONTS_PATH, file)))
+    # Decode the sounds with the mixer set up as it is in the game.
+    audio.pre_init()
+    pygame.mixer.init()
+    manifest["mixer"] = pygame.mixer.get_init()
+    for name, file in assets.SOUND_FILES.items():
+        sound = pygame.mixer.Sound(os.path.join(assets.AUDIO_PATH, file))
+        manifest["sounds"][name] = add(sound.get_raw())
+    pygame.mixer.quit()
+
+    encoded = json.dumps(manifest).encode()
+    header = assets.BUNDLE_HEADER.pack(assets.BUNDLE_MAGIC, assets.BUNDLE_VERSION, len(encoded))
+    start = assets.bundle_data_start(len(encoded))
+    # Write to a temporary file first so that a running game never sees
+    # half a bundle.
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(encoded)
+        f.write(bytes(start - len(header) - len(encoded)))
+        for blob in blobs:
+            f.write(blob)
+    os.replace(temp_path, path)
+    return start + offset
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else assets.BUNDLE_FILE
+    start = time.perf_counter()
+    size = build(path)
+    print(f"Wrote {path} ({size / 1024:.0f}KB) in {time.perf_counter() - start:.2f}s")
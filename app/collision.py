@@ -0,0 +1,103 @@
+"""
+Broadphase collision detection between balloons and other sprites.
+"""
+import numpy as np
+
+class Broadphase:
+    """
+    Sweep-and-prune broadphase over the balloons in a BalloonStore. The
+    balloons are sorted by the left edge of their rects once per tick, so
+    a query only tests the balloons whose left edges are close enough to
+    the query rect to overlap it.
+    """
+    def __init__(self, store):
+        """
+        Create a broadphase for the balloons in store.
+        """
+        self.store = store
+        self.slots = np.zeros(0, dtype=np.int64)
+        self.left = np.zeros(0, dtype=np.int64)
+        self.top = np.zeros(0, dtype=np.int64)
+        self.right = np.zeros(0, dtype=np.int64)
+        self.bottom = np.zeros(0, dtype=np.int64)
+        self.max_w = 0
+
+    def rebuild(self):
+        """
+        Sort the balloons by the left edges of their rects. This must be done
+        after the balloons move and before they are queried.
+        """
+        store = self.store
+        slots = np.flatnonzero(store.alive)
+        # The rects of the balloons are their positions, truncated.
+        left = store.x[slots].astype(np.int64)
+        order = np.argsort(left, kind='stable')
+        self.slots = slots[order]
+        self.left = left[order]
+        self.right = self.left + store.w[self.slots]
+        self.top = store.y[self.slots].astype(np.int64)
+        self.bottom = self.top + store.h[self.slots]
+        self.max_w = int(store.w[self.slots].max()) if len(slots) else 0
+
+    def query(self, rect):
+        """
+        Return the slots of the balloons whose rects collide with rect, in
+        the order the balloons were added to the store.
+        """
+        # A balloon can only overlap rect if its left edge is within the
+        # widest balloon of rect's left edge.
+        lo = np.searchsorted(self.left, rect.left - self.max_w, side='right')
+        hi = np.searchsorted(self.left, rect.right, side='left')
+        if lo >= hi or rect.width == 0 or rect.height == 0:
+            return []
+        # The same test as pygame.Rect.colliderect.
+        hit = ((self.right[lo:hi] > rect.left) &
+               (self.top[lo:hi] < rect.bottom) &
+               (self.bottom[lo:hi] > rect.top))
+        slots = self.slots[lo:hi][hit]
+        return slots[np.argsort(self.store.serial[slots])].tolist()
+
+    def sweep(self, rect, prev_top):
+        """
+        Return the slots of the balloons that collided with rect at any time
+        during the last tick, in the order they first touched it and then
+        the order they were added to the store. The top of rect moved from
+        prev_top to rect.top during the tick while its other edges stayed
+        put, and each balloon moved in a straight line from its position
+        before the tick to its position now.
+        """
+        store = self.store
+        slots = self.slots
+        if len(slots) == 0 or rect.width == 0:
+            return []
+        # The rects of the balloons before and after the tick.
+        x0 = np.trunc(store.prev_x[slots])
+        y0 = np.trunc(store.prev_y[slots])
+        dx = self.left - x0
+        dy = self.top - y0
+        w = store.w[slots]
+        h = store.h[slots]
+        # The rects overlap at time t in [0, 1] while each of these edge
+        # distances, a + b * t, is positive.
+        a = np.stack((rect.right - x0,
+                      x0 + w - rect.left,
+                      rect.bottom - y0,
+                      y0 + h - prev_top))
+        b = np.stack((-dx, dx, -dy, dy - (rect.top - prev_top)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            root = -a / b
+        start = np.where(b > 0, root, 0.0).max(axis=0)
+        end = np.where(b < 0, root, 1.0).min(axis=0)
+        # A distance that does not change must be positive throughout.
+        never = ((b == 0) & (a <= 0)).any(axis=0)
+        hit = ~never & (start < end)
+        order = np.lexsort((store.serial[slots[hit]], start[hit]))
+        return slots[hit][order].tolist()
+
+    def collide(self, sprite):
+        """
+        Return the balloons whose rects collide with the sprite's rect, in the
+        order they were added to the store.
+        """
+        owners = self.store.owners
+        return [owners[slot] for slot in self.query(sprite.rect)]
@@ -0,0 +1,118 @@
+"""
+Cached text and the heads-up display shown below the stage.
+"""
+from collections import OrderedDict
+import pygame
+import assets
+
+# Predefine some colors
+RED   = (255, 0, 0)
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+GOLD = (255, 215, 0)
+
+# Popping this many balloons fills the progress bar.
+PROGRESS_BALLOONS = 280
+# Position of the progress bar in the HUD, and its size.
+BAR_POS = (230, 9)
+BAR_WIDTH = 300
+BAR_HEIGHT = 25
+
+class TextCache:
+    """
+    Rendered text, keyed by font, string and colour. When the cache is full
+    the least recently used text is dropped.
+    """
+    def __init__(self, max_size=64):
+        """
+        Create an empty cache that holds at most max_size rendered strings.
+        """
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, colour, antialias=True):
+        """
+        Return a surface with the text rendered in font and colour, rendering
+        it only if it is not already in the cache.
+        """
+        key = (font, text, colour, antialias)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = font.render(text, antialias, colour)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+class Hud:
+    """
+    The HUD, showing the level, the lives left and the progress through the
+    level. The parts that only change with the level or lives are drawn on
+    a layer that is rebuilt when they change.
+    """
+    def __init__(self, rect, font, text_cache):
+        """
+        Create a HUD to be drawn in rect, with labels in font.
+        """
+        self.rect = rect
+        self.font = font
+        self.text_cache = text_cache
+        self.layer = None
+        self.layer_values = None # The level and lives shown on the layer.
+
+    def build_layer(self, level, lives):
+        """
+        Draw the ground, labels, life icons and progress bar outline.
+        """
+        if self.layer is None:
+            self.layer = pygame.Surface(self.rect.size)
+            if pygame.display.get_surface() is not None:
+                self.layer = self.layer.convert()
+        layer = self.layer
+        # Draw the ground.
+        layer.fill(WHITE)
+        # text
+        rh_pos = (self.rect.width-200, 5)
+        lh_pos = (10, 10)
+        level_text = self.text_cache.render(self.font, f"Level: {level}", BLACK)
+        life_text = self.text_cache.render(self.font, "Lives:", BLACK)
+        layer.blit(level_text, lh_pos)
+        layer.blit(life_text, rh_pos)
+        # life icons
+        life_x, life_y = rh_pos
+        life_x += 80
+        for _ in range(lives):
+            layer.blit(assets.image("player_life"), (life_x, life_y))
+            life_x += 40
+        # progress bar outline
+        pygame.draw.rect(surface=layer,
+                         rect=pygame.Rect(BAR_POS, (BAR_WIDTH, BAR_HEIGHT)),
+                         color=BLACK,
+                         width=1,
+                         border_radius=5)
+        self.layer_values = (level, lives)
+
+    def draw(self, surface, level, lives, popped_count):
+        """
+        Draw the HUD, rebuilding the layer if the level or lives have changed.
+        """
+        if self.layer_values != (level, lives):
+            self.build_layer(level, lives)
+        surface.blit(self.layer, self.rect)
+        # progress bar
+        popped_in_level = popped_count % PROGRESS_BALLOONS
+        progress_w = int((popped_in_level/PROGRESS_BALLOONS)*BAR_WIDTH)
+        l, t = self.rect.left + BAR_POS[0], self.rect.top + BAR_POS[1]
+        if progress_w > 294:
+            right_rad = 5
+        else:
+            right_rad = 0
+        pygame.draw.rect(surface=surface,
+                         rect=pygame.Rect(l, t, progress_w, BAR_HEIGHT),
+                         color=RED,
+                         border_top_left_radius=5,
+                         border_top_right_radius=right_rad,
+                         border_bottom_left_radius=5,
+                         border_bottom_right_radius=right_rad)
@@ -0,0 +1,79 @@
+"""
+Render interpolation. The game is simulated at a fixed rate but drawn at
+whatever rate the display can manage, so a frame usually falls between two
+ticks. Drawing the sprites part of the way between where they were before
+the last tick and where they are now keeps their motion smooth.
+"""
+import numpy as np
+
+class Interpolator:
+    """
+    The positions of the balloons and the player before the last tick.
+    """
+    def __init__(self):
+        """
+        Create an interpolator with no saved positions.
+        """
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.serial = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.player_x = None
+
+    def clear(self):
+        """
+        Forget the saved positions, so that sprites are drawn where they are.
+        """
+        self.alive[:] = False
+        self.player_x = None
+
+    def has_saved(self):
+        """
+        Return True if positions have been saved since the game started.
+        """
+        return self.player_x is not None
+
+    def save(self, sim):
+        """
+        Save the positions of the sprites in sim before it is stepped.
+        """
+        store = sim.balloon_store
+        if len(self.x) != store.capacity:
+            self.x = store.x.copy()
+            self.y = store.y.copy()
+            self.serial = store.serial.copy()
+            self.alive = store.alive.copy()
+        else:
+            np.copyto(self.x, store.x)
+            np.copyto(self.y, store.y)
+            np.copyto(self.serial, store.serial)
+            np.copyto(self.alive, store.alive)
+        self.player_x = sim.player.rect.x
+
+    def blits(self, sim, alpha, player=True):
+        """
+        Return the images of the sprites in sim with where to draw them, alpha
+        of the way from their saved positions to their current ones. Sprites
+        without a saved position are drawn where they are. Positions must
+        have been saved.
+        """
+        store = sim.balloon_store
+        balloons = sim.balloons.sprites()
+        slots = np.fromiter((b.slot for b in balloons), dtype=np.int64, count=len(balloons))
+        x = store.x[slots]
+        y = store.y[slots]
+        # Only balloons that were in the same slot before the tick have moved
+        # from their saved positions.
+        known = slots < len(self.x)
+        saved = np.where(known, slots, 0)
+        moved = known & self.alive[saved] & (self.serial[saved] == store.serial[slots])
+        x = np.where(moved, self.x[saved] + (x - self.x[saved]) * alpha, x)
+        y = np.where(moved, self.y[saved] + (y - self.y[saved]) * alpha, y)
+        blits = [(b.image, (bx, by)) for b, bx, by in
+                 zip(balloons, x.astype(np.int64).tolist(), y.astype(np.int64).tolist())]
+        blits.extend((a.image, a.rect) for a in sim.arrows)
+        if player:
+            rect = sim.player.rect
+            px = round(self.player_x + (rect.x - self.player_x) * alpha)
+            blits.append((sim.player.image, (px, rect.y)))
+        return blits
@@ -0,0 +1,191 @@
+"""
+Batched balloon physics. The state of every balloon is kept in a
+structure of NumPy arrays so that all balloons can be moved in one step.
+"""
+import numpy as np
+
+# Physics Constants
+# Vertical acceleration due to gravity. The higher this value, the faster the arc.
+GRAVITY = 0.5
+# Initial horizontal speed (constant).
+INITIAL_SPEED_X = 3
+# Initial vertical speed (upwards) when the balloon is created or bounces.
+INITIAL_SPEED_Y = 20
+
+# Bits in BalloonStore.flags.
+FLAG_LEVEL = 1 # A level balloon.
+FLAG_STAR = 2 # A level balloon currently showing the star.
+FLAG_FREEZER = 4 # A balloon whose size 1 children freeze the others.
+
+# The arrays of a BalloonStore, in the order they are saved in snapshots.
+STORE_ARRAYS = ('x', 'y', 'prev_x', 'prev_y', 'vx', 'vy', 'w', 'h', 'size', 'flags',
+                'waiting', 'alive', 'serial')
+
+class BalloonStore:
+    """
+    Structure-of-arrays storage for the position, velocity, size and flags
+    of balloons. Each balloon owns a slot in the arrays, which is returned
+    to the store when the balloon is removed.
+    """
+    def __init__(self, bounds, capacity=64):
+        """
+        Create an empty store for balloons that move in the given bounds.
+        """
+        self.bounds = bounds
+        self.capacity = 0
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        # Positions before the last tick, for swept collision tests.
+        self.prev_x = np.zeros(0)
+        self.prev_y = np.zeros(0)
+        self.vx = np.zeros(0)
+        self.vy = np.zeros(0)
+        self.w = np.zeros(0, dtype=np.int64)
+        self.h = np.zeros(0, dtype=np.int64)
+        self.size = np.zeros(0, dtype=np.int8)
+        self.flags = np.zeros(0, dtype=np.uint8)
+        self.waiting = np.zeros(0, dtype=bool)
+        self.alive = np.zeros(0, dtype=bool)
+        self.serial = np.zeros(0, dtype=np.int64) # The order balloons were added in.
+        self.next_serial = 0
+        self.owners = [] # The sprite that owns each slot.
+        self.free = [] # Unused slots.
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        """
+        Enlarge the arrays to hold capacity balloons.
+        """
+        extra = capacity - self.capacity
+        for name in STORE_ARRAYS:
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate((array, np.zeros(extra, dtype=array.dtype))))
+        self.owners.extend([None] * extra)
+        # Hand out the lowest slots first.
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def add(self, owner, x, y, vx, vy, w, h, size, flags, waiting):
+        """
+        Store the state of a new balloon and return its slot.
+        """
+        if not self.free:
+            self.grow(self.capacity * 2)
+        slot = self.free.pop()
+        self.x[slot] = self.prev_x[slot] = x
+        self.y[slot] = self.prev_y[slot] = y
+        self.vx[slot] = vx
+        self.vy[slot] = vy
+        self.w[slot] = w
+        self.h[slot] = h
+        self.size[slot] = size
+        self.flags[slot] = flags
+        self.waiting[slot] = waiting
+        self.alive[slot] = True
+        self.serial[slot] = self.next_serial
+        self.next_serial += 1
+        self.owners[slot] = owner
+        return slot
+
+    def remove(self, slot):
+        """
+        Release the slot of a balloon that has been removed from the game.
+        """
+        self.alive[slot] = False
+        self.owners[slot] = None
+        self.free.append(slot)
+
+    def clear(self):
+        """
+        Remove every balloon, keeping the arrays for reuse.
+        """
+        self.alive[:] = False
+        self.owners[:] = [None] * self.capacity
+        self.free[:] = range(self.capacity - 1, -1, -1)
+        self.next_serial = 0
+
+    def snapshot(self):
+        """
+        Return the arrays and free slots of the store as bytes. The owners of
+        the slots are not included.
+        """
+        parts = [getattr(self, name).tobytes() for name in STORE_ARRAYS]
+        parts.append(np.array(self.free, dtype=np.int64).tobytes())
+        return b"".join(parts)
+
+    def restore(self, data, offset, capacity, next_serial, num_free):
+        """
+        Replace the state of the store with a snapshot that starts at offset
+        in data, and return the offset of the end of the snapshot. Every
+        slot is left without an owner.
+        """
+        if capacity != self.capacity:
+            for name in STORE_ARRAYS:
+                setattr(self, name, np.zeros(capacity, dtype=getattr(self, name).dtype))
+            self.capacity = capacity
+        for name in STORE_ARRAYS:
+            array = getattr(self, name)
+            np.copyto(array, np.frombuffer(data, array.dtype, capacity, offset))
+            offset += array.nbytes
+        self.free[:] = np.frombuffer(data, np.int64, num_free, offset).tolist()
+        self.owners[:] = [None] * capacity
+        self.next_serial = next_serial
+        return offset + num_free * 8
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def step(self):
+        """
+        Move every balloon that is not waiting by one tick, with gravity,
+        wall bounce and floor bounce, then sync the rects of the moved
+        balloons.
+        """
+        self.hold()
+        active = self.alive & ~self.waiting
+        if not active.any():
+            return
+        # Wall collisions are detected from the rect before the move.
+        left = np.trunc(self.x)
+        vy = self.vy + GRAVITY
+        x = self.x + self.vx
+        y = self.y + vy
+        hit_left = left <= self.bounds['min_x']
+        hit_right = ~hit_left & (left + self.w >= self.bounds['max_x'])
+        # Reverse horizontal direction and prevent sticking to the wall.
+        vx = np.where(hit_left | hit_right, -self.vx, self.vx)
+        x = np.where(hit_left, 1.0, x)
+        x = np.where(hit_right, self.bounds['max_x'] - self.w - 1.0, x)
+        # Bounce off the floor without falling through it.
+        floor = self.bounds['max_y'] - self.h
+        hit_floor = y >= floor
+        vy = np.where(hit_floor, -INITIAL_SPEED_Y, vy)
+        y = np.where(hit_floor, floor, y)
+        np.copyto(self.x, x, where=active)
+        np.copyto(self.y, y, where=active)
+        np.copyto(self.vx, vx, where=active)
+        np.copyto(self.vy, vy, where=active)
+        # Level balloons flip between star and clock on each bounce.
+        flipped = active & hit_floor & ((self.flags & FLAG_LEVEL) != 0)
+        self.flags[flipped] ^= FLAG_STAR
+        self.sync(np.flatnonzero(active), np.flatnonzero(flipped))
+
+    def hold(self):
+        """
+        Note that the balloons are where they were before the last tick.
+        """
+        np.copyto(self.prev_x, self.x)
+        np.copyto(self.prev_y, self.y)
+
+    def sync(self, moved, flipped):
+        """
+        Copy the positions of the moved slots into their sprites' rects and
+        update the images of flipped level balloons.
+        """
+        xs = self.x[moved].astype(np.int64).tolist()
+        ys = self.y[moved].astype(np.int64).tolist()
+        owners = self.owners
+        for slot, x, y in zip(moved.tolist(), xs, ys):
+            owners[slot].rect.topleft = (x, y)
+        for slot in flipped.tolist():
+            owners[slot].update_image()
@@ -0,0 +1,350 @@
+"""
+Trajectory prediction for balloons. A moving balloon follows the same rules
+on every tick, so where it will be any number of ticks from now can be
+worked out directly instead of stepping the simulation.
+
+Vertically, a balloon falls under gravity until it first reaches the floor,
+and from then on repeats the same bounce, which lasts BOUNCE_TICKS.
+Horizontally, it moves at a constant speed until it reaches a wall, where
+it is put back just inside the stage and turned around, and from then on
+goes to and fro between the walls. A balloon that reaches a wall while
+moving away from it (new balloons start in a corner) is turned around
+twice before it settles into that cycle.
+"""
+import numpy as np
+from physics import GRAVITY, INITIAL_SPEED_Y
+from simulation import EVENT_UNFREEZE, EVENT_FRESH_BALLOON_WAIT
+
+# The number of ticks between two bounces of a balloon on the floor.
+BOUNCE_TICKS = next(p for p in range(1, 1000)
+                    if -INITIAL_SPEED_Y * p + GRAVITY * p * (p + 1) / 2 >= 0)
+
+# Used as the number of ticks before a balloon moves when it may never move.
+NEVER = 1 << 30
+
+class Predictor:
+    """
+    The future positions of the balloons in a store, as they would move if
+    nothing else happened in the game.
+    """
+    def __init__(self, store, delays=None):
+        """
+        Predict the balloons that are alive in store. delays is the number
+        of ticks each one waits before it starts to move, by slot, or None
+        if they all move on the next tick.
+        """
+        bounds = store.bounds
+        self.slots = np.flatnonzero(store.alive)
+        slots = self.slots
+        self.w = store.w[slots]
+        self.h = store.h[slots]
+        self.delay = (np.zeros(len(slots), dtype=np.int64) if delays is None
+                      else np.asarray(delays, dtype=np.int64)[slots])
+        self.init_horizontal(store.x[slots], store.vx[slots], bounds['min_x'], bounds['max_x'])
+        self.init_vertical(store.y[slots], store.vy[slots], bounds['max_y'])
+        # Segments of the paths, worked out when they are first needed.
+        self.bounce = None
+        self.runs = {} # The x segments for each horizon asked about.
+
+    @classmethod
+    def of(cls, sim):
+        """
+        Return a predictor for the balloons in sim, which waits for frozen
+        balloons to thaw and new balloons to start moving.
+        """
+        store = sim.balloon_store
+        pending = sim.scheduler.pending()
+        # An event that fires in r ticks lets the balloons move on that tick.
+        def wait(event):
+            return pending[event][0] - 1 if event in pending else NEVER
+        delays = np.zeros(store.capacity, dtype=np.int64)
+        if sim.frozen_all or sim.frozen_balloons:
+            delays[:] = wait(EVENT_UNFREEZE)
+        delays[store.waiting] = np.maximum(delays[store.waiting], wait(EVENT_FRESH_BALLOON_WAIT))
+        return cls(store, delays)
+
+    def init_horizontal(self, x, vx, min_x, max_x):
+        """
+        Work out when each balloon first reaches a wall and where it joins
+        the cycle between the walls.
+        """
+        speed = np.abs(vx)
+        # Balloons with their left edges at or left of min_x, or their right
+        # edges at or right of max_x, are bounced.
+        lo = min_x + 1.0
+        hi = max_x - self.w.astype(float)
+        at_left = x < lo
+        at_right = ~at_left & (x >= hi)
+        # Ticks of free movement before a wall is reached.
+        to_left = np.floor((x - lo) / np.where(speed > 0, speed, 1)) + 1
+        to_right = np.ceil((hi - x) / np.where(speed > 0, speed, 1))
+        free = np.where(at_left | at_right, 0, np.where(vx < 0, to_left, to_right))
+        free = np.where(speed > 0, free, NEVER).astype(np.int64)
+        hits_left = at_left | (~at_right & (vx < 0))
+        # Where the balloon is put back, and its velocity afterwards.
+        self.x0 = x
+        self.vx0 = vx
+        self.free = free
+        self.clamp = np.where(hits_left, lo, hi - 1)
+        # A balloon turned around towards the wall it hit is turned around
+        # again two ticks later, at the same place.
+        self.twice = np.where(hits_left, vx > 0, vx < 0)
+        self.speed = speed
+        # The cycle starts at lo moving right. It reaches hi after right
+        # ticks, is put back at hi - 1, and gets back to lo after left ticks.
+        safe = np.where(speed > 0, speed, 1)
+        self.right = np.ceil((hi - lo) / safe).astype(np.int64)
+        self.left = (np.floor((hi - 1 - lo) / safe) + 1).astype(np.int64)
+        self.period_x = self.right + self.left + 2
+        self.lo = lo
+        self.hi = hi
+        # The tick the balloon joins the cycle, and its phase at that tick.
+        self.cycle_start = free + np.where(self.twice, 3, 1)
+        self.cycle_phase = np.where(hits_left, 0, self.right + 1)
+
+    def init_vertical(self, y, vy, max_y):
+        """
+        Work out when each balloon first reaches the floor.
+        """
+        floor = (max_y - self.h).astype(float)
+        # Solve y + vy k + GRAVITY k (k + 1) / 2 >= floor for the first k,
+        # then correct for rounding.
+        a = GRAVITY / 2
+        b = vy + GRAVITY / 2
+        c = y - floor
+        root = (-b + np.sqrt(np.maximum(b * b - 4 * a * c, 0))) / (2 * a)
+        k = np.maximum(np.ceil(root), 1).astype(np.int64)
+        k = np.where((k > 1) & (self.fall(y, vy, k - 1) >= floor), k - 1, k)
+        k = np.where(self.fall(y, vy, k) < floor, k + 1, k)
+        self.y0 = y
+        self.vy0 = vy
+        self.floor = floor
+        self.landing = k
+
+    @staticmethod
+    def fall(y, vy, k):
+        """
+        Return the height after k ticks of a balloon at y moving at vy, if
+        it does not reach the floor.
+        """
+        return y + vy * k + GRAVITY * k * (k + 1) / 2
+
+    def __len__(self):
+        return len(self.slots)
+
+    def position(self, ticks):
+        """
+        Return the x and y of each balloon the given number of ticks from
+        now. ticks may be an array, such as a column of ticks to get the
+        positions at several times at once.
+        """
+        k = np.maximum(np.asarray(ticks, dtype=np.int64) - self.delay, 0)
+        return self.horizontal(k), self.vertical(k)
+
+    def horizontal(self, k):
+        """
+        Return the x of each balloon after it has moved for k ticks.
+        """
+        free = self.free
+        turned = self.clamp - self.vx0 * (k - free - 1)
+        phase = (self.cycle_phase + k - self.cycle_start) % self.period_x
+        cycle = np.where(phase <= self.right,
+                         self.lo + self.speed * phase,
+                         self.hi - 1 - self.speed * (phase - self.right - 1))
+        return np.where(k <= free, self.x0 + self.vx0 * k,
+                        np.where(k >= self.cycle_start, cycle, turned))
+
+    def vertical(self, k):
+        """
+        Return the y of each balloon after it has moved for k ticks.
+        """
+        phase = (k - self.landing) % BOUNCE_TICKS
+        bounce = self.floor - INITIAL_SPEED_Y * phase + GRAVITY * phase * (phase + 1) / 2
+        return np.where(k < self.landing, self.fall(self.y0, self.vy0, k), bounce)
+
+    def rects(self, ticks):
+        """
+        Return the left, top, right and bottom edges of each balloon's rect
+        the given number of ticks from now.
+        """
+        x, y = self.position(ticks)
+        left = np.trunc(x).astype(np.int64)
+        top = np.trunc(y).astype(np.int64)
+        return left, top, left + self.w, top + self.h
+
+    def track(self, horizon):
+        """
+        Return the rects of every balloon on each of the next horizon ticks,
+        as arrays of edges indexed by tick - 1 and balloon. This works out
+        every tick, so it is meant for short horizons; next_crossing and
+        earliest_collision solve for the tick instead.
+        """
+        return self.rects(np.arange(1, horizon + 1)[:, None])
+
+    def next_crossing(self, x, below=None, horizon=BOUNCE_TICKS * 4):
+        """
+        Return the first tick, from the next one, on which each balloon's
+        rect spans the column at x, with its bottom lower than below if it
+        is given, or -1 if it does not within horizon ticks.
+        """
+        top = -NEVER if below is None else below - self.h + 1
+        return self.first_time(x - self.w + 1, x, top, NEVER, horizon)
+
+    def earliest_collision(self, rect, horizon=BOUNCE_TICKS * 4):
+        """
+        Return the first tick, from the next one, on which a balloon's rect
+        collides with rect, such as the player's, and the slot of that
+        balloon, or (-1, None) if none does within horizon ticks.
+        """
+        ticks = self.first_time(rect.left - self.w + 1, rect.right - 1,
+                                rect.top - self.h + 1, rect.bottom - 1, horizon)
+        ticks = np.where(ticks < 0, horizon + 1, ticks)
+        if len(ticks) == 0 or ticks.min() > horizon:
+            return -1, None
+        i = int(np.argmin(ticks))
+        return int(ticks[i]), int(self.slots[i])
+
+    def first_time(self, min_left, max_left, min_top, max_top, horizon):
+        """
+        Return the first tick, from the next one, on which the left and top
+        edges of each balloon's rect are both within the given limits, or -1
+        if they are not within horizon ticks.
+
+        The path of a balloon is split into segments on which its x or y
+        only goes one way: the wall runs, the fall to the floor and the rise
+        and fall of a bounce. The ticks each segment spends within the
+        limits are solved for, and since every bounce is the same, the first
+        tick after a wall run starts that is also in the right part of a
+        bounce is found from BOUNCE_TICKS.
+        """
+        if horizon not in self.runs:
+            self.runs[horizon] = self.x_segments(horizon)
+        x_start, x_end = span(self.runs[horizon], 0, min_left, max_left)
+        # A balloon stays where it is for its delay, so its position on the
+        # ticks up to then is the one it has after moving for 0 ticks.
+        x_start = np.maximum(x_start, np.where(self.delay > 0, 0, 1))
+        x_end = np.minimum(x_end, np.maximum(horizon - self.delay, 0))
+        if self.bounce is None:
+            self.bounce = self.y_segments()
+        y_start, y_end = span(self.bounce, GRAVITY, min_top, max_top)
+        found = []
+        # Before the balloon lands.
+        for i in (0, 1):
+            k = np.maximum(x_start, y_start[i])
+            found.append(np.where(k <= np.minimum(x_end, y_end[i]), k, NEVER))
+        # After it lands, where the bounce phases are within the limits.
+        start = np.maximum(x_start, self.landing)
+        phase = (start - self.landing) % BOUNCE_TICKS
+        for i in (2, 3):
+            wait = np.where(phase < y_start[i], y_start[i] - phase,
+                            np.where(phase <= y_end[i], 0, BOUNCE_TICKS - phase + y_start[i]))
+            k = start + wait
+            found.append(np.where((y_start[i] <= y_end[i]) & (k <= x_end), k, NEVER))
+        k = np.min(found, axis=(0, 1), initial=NEVER)
+        return np.where(k == NEVER, -1, np.where(k == 0, 1, k + self.delay))
+
+    def x_segments(self, ticks):
+        """
+        Return the segments of the horizontal path of each balloon over its
+        first ticks of movement: the run to the first wall, the ticks it is
+        turned around for, and enough of the runs between the walls after
+        that. Each is described as in span.
+        """
+        free = self.free
+        moving = self.speed > 0
+        runs = ticks // max(1, int(np.min(np.minimum(self.right, self.left)[moving],
+                                          initial=ticks))) + 2
+        r = np.arange(runs)[:, None]
+        starts_right = self.cycle_phase == 0
+        rightward = (r % 2 == 0) == starts_right
+        run_start = (self.cycle_start + r // 2 * self.period_x +
+                     r % 2 * np.where(starts_right, self.right + 1, self.left + 1))
+        base = np.vstack([np.zeros_like(free), free + 1, run_start])
+        last = np.vstack([free, self.cycle_start - 1,
+                          run_start + np.where(rightward, self.right, self.left)])
+        origin = np.vstack([self.x0, self.clamp, np.where(rightward, self.lo, self.hi - 1)])
+        slope = np.vstack([self.vx0, -self.vx0, np.where(rightward, self.speed, -self.speed)])
+        return base, base, last, origin, slope, slope >= 0
+
+    def y_segments(self):
+        """
+        Return the segments of the vertical path of each balloon: its rise
+        and fall before it first lands, then the rise and fall of a bounce,
+        in ticks from the start of the bounce. Each is described as in span.
+        """
+        landing = self.landing
+        zero = np.zeros_like(landing)
+        # y stops going down on the tick that -vy / GRAVITY is reached.
+        top = np.floor(-self.vy0 / GRAVITY).astype(np.int64)
+        bounce_top = np.full(len(landing), INITIAL_SPEED_Y // GRAVITY, dtype=np.int64)
+        first = np.vstack([zero, np.maximum(top + 1, 0), zero, bounce_top + 1])
+        last = np.vstack([np.minimum(top, landing - 1), landing - 1, bounce_top,
+                          np.full(len(landing), BOUNCE_TICKS - 1)])
+        origin = np.vstack([self.y0, self.y0, self.floor, self.floor])
+        vy = np.full(len(landing), -float(INITIAL_SPEED_Y))
+        slope = np.vstack([self.vy0, self.vy0, vy, vy])
+        # y goes up as the balloon falls.
+        falling = np.broadcast_to(np.array([False, True, False, True])[:, None], first.shape)
+        return np.zeros_like(first), first, last, origin, slope, falling
+
+def segment_value(base, origin, slope, accel, k):
+    """
+    Return the value on tick k of a segment that starts from origin on tick
+    base, changing by slope and then by accel more on each tick.
+    """
+    j = k - base
+    return origin + slope * j + accel * j * (j + 1) / 2
+
+def first_past(segments, accel, n):
+    """
+    Return the first tick of each segment on which the value truncated to
+    an integer is at least n if the segment goes up, or at most n if it
+    goes down, or one after its last tick if there is none.
+    """
+    base, first, last, origin, slope, up = segments
+    n = np.broadcast_to(n, base.shape)
+    def reached(k):
+        v = np.trunc(segment_value(base, origin, slope, accel, k))
+        return np.where(up, v >= n, v <= n)
+    # Where the value reaches the limit, allowing for truncation towards
+    # zero.
+    limit = np.where(up, np.where(n > 0, n, n - 1), np.where(n >= 0, n + 1, n)).astype(float)
+    if accel == 0:
+        safe = np.where(slope != 0, slope, 1)
+        j = np.where(slope != 0, (limit - origin) / safe, -np.inf)
+    else:
+        a = accel / 2
+        b = slope + accel / 2
+        root = np.sqrt(np.maximum(b * b - 4 * a * (origin - limit), 0))
+        j = np.where(up, -b + root, -b - root) / (2 * a)
+    k = np.clip(np.ceil(j), first - base, last + 1 - base).astype(np.int64) + base
+    # Correct for rounding.
+    k = np.where((k <= last) & ~reached(k), k + 1, k)
+    k = np.where((k > first) & reached(k - 1), k - 1, k)
+    return np.where((k <= last) & ~reached(k), last + 1, k)
+
+def span(segments, accel, low, high):
+    """
+    Return the first and last tick of each segment on which its value
+    truncated to an integer is from low to high, or a first tick after the
+    last if there are none. A segment is described by the tick of its
+    origin, its first and last ticks, its value at the origin, how much
+    that changes on the first tick, and whether it goes up.
+    """
+    first, last, up = segments[1], segments[2], segments[-1]
+    # Solve for both ends at once.
+    count = len(first)
+    both = tuple(np.concatenate([a, a]) for a in segments)
+    limits = np.concatenate([np.where(up, low, high), np.where(up, high + 1, low - 1)])
+    ticks = first_past(both, accel, limits)
+    return np.maximum(ticks[:count], first), np.minimum(ticks[count:] - 1, last)
+
+def first_tick(hits):
+    """
+    Return the first tick that is True in each column of hits, indexed by
+    tick - 1 and balloon, or -1 for columns with none.
+    """
+    if hits.shape[0] == 0:
+        return np.full(hits.shape[1], -1, dtype=np.int64)
+    first = np.argmax(hits, axis=0)
+    return np.where(hits.any(axis=0), first + 1, -1)
@@ -0,0 +1,165 @@
+"""
+Frame profiling. The game loop marks the end of each phase of a frame
+with Profiler.lap, and the profiler keeps the time spent in every phase
+over a rolling window of frames, along with the number of sprites. The
+window can be shown on screen or saved as CSV or JSON.
+"""
+import collections
+import csv
+import json
+import time
+
+# Phases of a frame.
+PHASE_EVENTS = "events" # Handling pygame events.
+PHASE_WAIT = "wait" # Waiting for the clock, to keep to the frame rate.
+PHASE_TIMERS = "timers" # Firing and timed events in the simulation.
+PHASE_MOVE = "move_sprites"
+PHASE_PLAYER_COLLISION = "player_collision"
+PHASE_ARROW_COLLISION = "collide_arrows_balloons"
+PHASE_BACKGROUND = "draw_background"
+PHASE_SPRITES = "draw_sprites"
+PHASE_HUD = "draw_hud"
+PHASE_UPDATE = "display_update"
+PHASES = [PHASE_EVENTS, PHASE_WAIT, PHASE_TIMERS, PHASE_MOVE,
+          PHASE_PLAYER_COLLISION, PHASE_ARROW_COLLISION, PHASE_BACKGROUND,
+          PHASE_SPRITES, PHASE_HUD, PHASE_UPDATE]
+
+# Sprite counts recorded for each frame.
+COUNTS = ["balloons", "arrows", "all_sprites"]
+
+# Frames kept in the rolling window.
+HISTORY = 300
+
+class NullProfiler:
+    """
+    A profiler that records nothing, used when profiling is off.
+    """
+    def mark(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def begin_frame(self):
+        pass
+
+    def end_frame(self, sim, ticks):
+        pass
+
+NULL_PROFILER = NullProfiler()
+
+class Profiler:
+    """
+    Times the phases of each frame over a rolling window of frames.
+    """
+    def __init__(self, history=HISTORY):
+        """
+        Create a profiler that keeps the last history frames.
+        """
+        self.frames = collections.deque(maxlen=history)
+        self.count = 0 # The number of frames recorded.
+        self.times = dict.fromkeys(PHASES, 0.0) # Seconds in each phase this frame.
+        self.frame_start = time.perf_counter()
+        self.last = self.frame_start
+
+    def mark(self):
+        """
+        Start timing a phase, without counting the time since the last lap.
+        """
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Add the time since the last mark or lap to a phase.
+        """
+        now = time.perf_counter()
+        self.times[phase] += now - self.last
+        self.last = now
+
+    def begin_frame(self):
+        """
+        Start a new frame.
+        """
+        self.frame_start = self.last = time.perf_counter()
+
+    def end_frame(self, sim, ticks):
+        """
+        Record the frame, in which sim was stepped ticks times.
+        """
+        record = {'frame': self.count,
+                  'frame_ms': round((time.perf_counter() - self.frame_start) * 1000, 4),
+                  'ticks': ticks}
+        for phase in PHASES:
+            record[phase] = round(self.times[phase] * 1000, 4)
+            self.times[phase] = 0.0
+        record['balloons'] = len(sim.balloons)
+        record['arrows'] = len(sim.arrows)
+        record['all_sprites'] = len(sim.all_sprites)
+        self.frames.append(record)
+        self.count += 1
+
+    def summary(self):
+        """
+        Return the mean and greatest time in ms of each phase and of whole
+        frames over the window, by name.
+        """
+        summary = {}
+        frames = self.frames
+        for name in ['frame_ms'] + PHASES:
+            values = [f[name] for f in frames] or [0.0]
+            summary[name] = (sum(values) / len(values), max(values))
+        return summary
+
+    def save(self, path):
+        """
+        Save the frames in the window, as CSV if path ends with .csv and
+        otherwise as JSON.
+        """
+        with open(path, "w", newline="") as f:
+            if path.endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=['frame', 'frame_ms', 'ticks'] +
+                                        PHASES + COUNTS)
+                writer.writeheader()
+                writer.writerows(self.frames)
+            else:
+                json.dump(list(self.frames), f, indent=1)
+
+class Overlay:
+    """
+    Shows the profiler's summary over the stage.
+    """
+    # Frames between updates of the text, so that it can be read.
+    UPDATE_FRAMES = 15
+    COLOUR = (255, 255, 0)
+    BACKGROUND = (0, 0, 0)
+
+    def __init__(self, profiler, font):
+        """
+        Create an overlay for profiler, written in font.
+        """
+        self.profiler = profiler
+        self.font = font
+        self.lines = []
+        self.updated = -self.UPDATE_FRAMES
+
+    def draw(self, surface, sim):
+        """
+        Draw the overlay in the top left corner of surface and return the
+        area it covers.
+        """
+        if self.profiler.count - self.updated >= self.UPDATE_FRAMES:
+            self.updated = self.profiler.count
+            summary = self.profiler.summary()
+            text = [f"{'ms':<24}{'mean':>6} {'max':>6}"]
+            text.extend(f"{name:<24}{mean:6.2f} {worst:6.2f}"
+                        for name, (mean, worst) in summary.items())
+            text.append(f"balloons {len(sim.balloons)}  arrows {len(sim.arrows)}  "
+                        f"sprites {len(sim.all_sprites)}")
+            self.lines = [self.font.render(line, True, self.COLOUR, self.BACKGROUND)
+                          for line in text]
+        y = 0
+        for line in self.lines:
+            surface.blit(line, (0, y))
+            y += line.get_height()
+        width = max((line.get_width() for line in self.lines), default=0)
+        return (0, 0, width, y)
@@ -0,0 +1,181 @@
+"""
+Recording and replaying games. A recording holds the seed and settings of
+a game and the player's input on every tick, which is all that is needed
+to play the game again exactly, headless and as fast as possible.
+
+Replay a recording from the command line with:
+
+    $ python app/replay.py game.sprl
+"""
+import struct
+import sys
+import time
+import zlib
+from simulation import Simulation, Inputs
+
+# File format: a header followed by the zlib compressed inputs, run length
+# encoded as pairs of an input byte and the number of ticks it was held.
+MAGIC = b"SPRL"
+VERSION = 1
+HEADER = struct.Struct("<4sHQHBII")
+RUN = struct.Struct("<BH")
+MAX_RUN = 0xFFFF
+
+# Bits in an input byte.
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_FIRE = 4
+
+# Bits in the settings byte.
+SETTING_GOD_MODE = 1
+SETTING_PIXEL_COLLISION = 2
+SETTING_SWEPT_COLLISION = 4
+
+def encode_input(inputs):
+    """
+    Pack the input for a tick into a byte.
+    """
+    return ((INPUT_LEFT if inputs.left else 0) |
+            (INPUT_RIGHT if inputs.right else 0) |
+            (INPUT_FIRE if inputs.fire else 0))
+
+# The input for each possible input byte.
+DECODED_INPUTS = [Inputs(left=bool(b & INPUT_LEFT),
+                         right=bool(b & INPUT_RIGHT),
+                         fire=bool(b & INPUT_FIRE)) for b in range(8)]
+
+def state_digest(sim):
+    """
+    Return a checksum of the state of the game, which is the same for two
+    games only if they have played out identically.
+    """
+    store = sim.balloon_store
+    slots = [b.slot for b in sim.balloons]
+    digest = zlib.crc32(struct.pack("<IIIIIi??", sim.tick, sim.level, sim.lives,
+                                    sim.balloon_count, sim.popped_count,
+                                    sim.player.rect.x, sim.frozen_balloons,
+                                    sim.frozen_all))
+    digest = zlib.crc32(store.x[slots].tobytes(), digest)
+    digest = zlib.crc32(store.y[slots].tobytes(), digest)
+    return zlib.crc32(store.size[slots].tobytes(), digest)
+
+class Recording:
+    """
+    The seed, settings and inputs of a game.
+    """
+    def __init__(self, seed, fps, god_mode=False, pixel_collision=False,
+                 swept_collision=False, inputs=None, digest=0):
+        """
+        Create a recording. inputs is a bytearray with one input byte per
+        tick and digest is the state_digest of the game when it ended.
+        """
+        self.seed = seed
+        self.fps = fps
+        self.god_mode = god_mode
+        self.pixel_collision = pixel_collision
+        self.swept_collision = swept_collision
+        self.inputs = inputs if inputs is not None else bytearray()
+        self.digest = digest
+
+    @classmethod
+    def of(cls, sim):
+        """
+        Start a recording of a new game.
+        """
+        return cls(sim.seed, sim.fps, sim.god_mode, sim.pixel_collision,
+                   sim.swept_collision)
+
+    def record(self, inputs):
+        """
+        Add the input for a tick.
+        """
+        self.inputs.append(encode_input(inputs))
+
+    def finish(self, sim):
+        """
+        Note the final state of the recorded game.
+        """
+        self.digest = state_digest(sim)
+
+    def to_bytes(self):
+        """
+        Encode the recording.
+        """
+        runs = bytearray()
+        inputs = self.inputs
+        i = 0
+        while i < len(inputs):
+            value = inputs[i]
+            j = i + 1
+            while j < len(inputs) and inputs[j] == value and j - i < MAX_RUN:
+                j += 1
+            runs += RUN.pack(value, j - i)
+            i = j
+        settings = ((SETTING_GOD_MODE if self.god_mode else 0) |
+                    (SETTING_PIXEL_COLLISION if self.pixel_collision else 0) |
+                    (SETTING_SWEPT_COLLISION if self.swept_collision else 0))
+        header = HEADER.pack(MAGIC, VERSION, self.seed, self.fps, settings,
+                             len(inputs), self.digest)
+        return header + zlib.compress(bytes(runs))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Decode a recording.
+        """
+        magic, version, seed, fps, settings, ticks, digest = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a Superpang recording")
+        runs = zlib.decompress(data[HEADER.size:])
+        inputs = bytearray()
+        for value, count in RUN.iter_unpack(runs):
+            inputs += bytes((value,)) * count
+        if len(inputs) != ticks:
+            raise ValueError("Recording is truncated")
+        return cls(seed, fps,
+                   god_mode=bool(settings & SETTING_GOD_MODE),
+                   pixel_collision=bool(settings & SETTING_PIXEL_COLLISION),
+                   swept_collision=bool(settings & SETTING_SWEPT_COLLISION),
+                   inputs=inputs,
+                   digest=digest)
+
+    def save(self, path):
+        """
+        Write the recording to a file.
+        """
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a recording from a file.
+        """
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+def replay(recording):
+    """
+    Play a recorded game headless and return the simulation at the end.
+    """
+    sim = Simulation(god_mode=recording.god_mode,
+                     fps=recording.fps,
+                     seed=recording.seed,
+                     pixel_collision=recording.pixel_collision,
+                     swept_collision=recording.swept_collision)
+    step = sim.step
+    for value in recording.inputs:
+        step(DECODED_INPUTS[value])
+    return sim
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        recording = Recording.load(path)
+        start = time.perf_counter()
+        sim = replay(recording)
+        elapsed = time.perf_counter() - start
+        outcome = "won" if sim.won else ("game over" if not sim.playing else "unfinished")
+        match = "matches" if state_digest(sim) == recording.digest else "DOES NOT MATCH"
+        print(f"{path}: {sim.tick} ticks ({sim.tick / recording.fps:.0f}s of play) "
+              f"replayed in {elapsed:.2f}s, level {sim.level}, "
+              f"{sim.popped_count} popped, {outcome}; final state {match} the recording")
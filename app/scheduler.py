@@ -0,0 +1,101 @@
+"""
+Timed events driven by simulation ticks rather than the wall clock.
+"""
+import heapq
+
+class Scheduler:
+    """
+    A priority queue of repeating timers, measured in ticks. Like
+    pygame.time.set_timer, there is at most one timer per event, setting a
+    timer replaces the existing one and an interval of 0 cancels it.
+    Events that fall due on the same tick fire in the order their timers
+    were set, so a run of the scheduler is fully deterministic.
+    """
+    def __init__(self):
+        """
+        Create a scheduler with no timers at tick 0.
+        """
+        self.tick = 0
+        self.queue = [] # Heap of (due tick, order, timer id, event).
+        self.timers = {} # Map from event to (timer id, interval).
+        self.order = 0 # Tie-breaker for timers due on the same tick.
+        self.next_id = 0
+
+    def set_timer(self, event, interval):
+        """
+        Fire event every interval ticks from now, replacing any existing
+        timer for the event. An interval of 0 cancels the timer.
+        """
+        if interval <= 0:
+            self.cancel(event)
+            return
+        timer_id = self.next_id
+        self.next_id += 1
+        self.timers[event] = (timer_id, interval)
+        self.push(self.tick + interval, timer_id, event)
+
+    def cancel(self, event):
+        """
+        Cancel the timer for event, if there is one. The entry left in the
+        queue is discarded when it reaches the front.
+        """
+        self.timers.pop(event, None)
+
+    def push(self, due, timer_id, event):
+        """
+        Add an entry to the queue.
+        """
+        heapq.heappush(self.queue, (due, self.order, timer_id, event))
+        self.order += 1
+
+    def advance(self):
+        """
+        Move on by one tick and return the events that fall due, in order.
+        Repeating timers are requeued for their next interval.
+        """
+        self.tick += 1
+        queue = self.queue
+        due = []
+        while queue and queue[0][0] <= self.tick:
+            when, _, timer_id, event = heapq.heappop(queue)
+            timer = self.timers.get(event)
+            if timer is None or timer[0] != timer_id:
+                # The timer was cancelled or replaced.
+                continue
+            due.append(event)
+            self.push(when + timer[1], timer_id, event)
+        return due
+
+    def pending(self):
+        """
+        Return a map from each event with a timer to a pair of the number of
+        ticks until it next fires and its interval.
+        """
+        remaining = {}
+        for when, _, timer_id, event in sorted(self.queue):
+            timer = self.timers.get(event)
+            if timer is not None and timer[0] == timer_id:
+                remaining[event] = (when - self.tick, timer[1])
+        return remaining
+
+    def restore(self, tick, pending):
+        """
+        Replace the timers with those in pending, a map like the one returned
+        by pending, at the given tick. Timers that fall due on the same tick
+        fire in the order they appear in pending.
+        """
+        self.clear()
+        self.tick = tick
+        for event, (remaining, interval) in pending.items():
+            timer_id = self.next_id
+            self.next_id += 1
+            self.timers[event] = (timer_id, interval)
+            self.push(tick + remaining, timer_id, event)
+
+    def clear(self):
+        """
+        Cancel every timer and return to tick 0.
+        """
+        self.tick = 0
+        self.queue.clear()
+        self.timers.clear()
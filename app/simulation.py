@@ -0,0 +1,584 @@
+"""
+Headless simulation of the Superpang game. The simulation owns the player,
+balloons, arrows and the score, and advances one tick at a time without
+needing a window, mixer or font.
+"""
+import random
+import struct
+import pygame
+from sprites import (Player, Balloon, Arrow, INITIAL_SPEED_Y, PLAYER_STANDING, PLAYER_FIRING,
+                     PLAYER_LEFT, PLAYER_RIGHT)
+from physics import BalloonStore
+from scheduler import Scheduler
+from collision import Broadphase
+from profiler import (NULL_PROFILER, PHASE_TIMERS, PHASE_MOVE, PHASE_PLAYER_COLLISION,
+                      PHASE_ARROW_COLLISION)
+
+FPS = 30
+
+# Screen information
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+STAGE_HEIGHT = 560
+
+NUM_LIVES = 3
+
+# Timed events.
+EVENT_ADD_BALLOON = "add_balloon" # Add a new balloon.
+EVENT_EXPLODE = "explode" # Explode one level of balloons.
+EVENT_UNFREEZE = "unfreeze" # Unfreeze entities.
+EVENT_FRESH_BALLOON_WAIT = "fresh_balloon_wait" # End the waiting period of new balloons.
+EVENT_INVINCIBILITY = "invincibility" # Player can't be harmed.
+EVENT_BLINK_PLAYER = "blink_player" # Flash Player icon.
+
+# Intervals between events, in ms.
+INTERVAL_FRESH_BALLOON = 20000
+INTERVAL_FRESH_BALLOON_WAIT = 2000
+INTERVAL_FREEZE_CLOCK = 4000
+INTERVAL_FREEZE_BALLOON = 2000
+INTERVAL_FREEZE_LOST_LIFE = 1500
+INTERVAL_EXPLODE = 500
+INTERVAL_INVINCIBILITY = 5000
+INTERVAL_BLINK_PLAYER = 300
+
+# Sound cues emitted by the simulation.
+SOUND_POP = "pop"
+SOUND_FIRE = "fire"
+SOUND_OW = "ow"
+SOUND_LEVEL = "level"
+
+# Miscellaneous constants.
+TOTAL_BALLOONS = 100
+BALLOON_BOUNDS = {'min_x':0, 'max_x': SCREEN_WIDTH, 'min_y': 0, 'max_y': STAGE_HEIGHT}
+# Seeds are stored in recordings and snapshots as 64 bit unsigned integers.
+MAX_SEED = 1 << 64
+
+# Snapshot format: a header of the counters, flags and sizes, the state of
+# the random number generator, the arrows, the timers, the slots of the
+# balloons in the order they are in their group and the balloon store.
+SNAPSHOT_MAGIC = b"SPSS"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHIIQBbHIiBiiBI?dBBIIQI")
+SNAPSHOT_RANDOM = struct.Struct("<625I") # The Mersenne Twister state.
+SNAPSHOT_ARROW = struct.Struct("<iiiii") # Centre, bottom, segments, height, previous top.
+SNAPSHOT_TIMER = struct.Struct("<BII") # Event, ticks until it fires, interval.
+# The flags saved as bits of one byte, and the events and player states by
+# their index in these lists.
+SNAPSHOT_FLAGS = ["make_freezer", "frozen_balloons", "frozen_all", "invincible",
+                  "player_visible", "playing", "won"]
+SNAPSHOT_EVENTS = [EVENT_ADD_BALLOON, EVENT_EXPLODE, EVENT_UNFREEZE, EVENT_FRESH_BALLOON_WAIT,
+                   EVENT_INVINCIBILITY, EVENT_BLINK_PLAYER]
+SNAPSHOT_PLAYER_STATES = [PLAYER_STANDING, PLAYER_FIRING, PLAYER_LEFT, PLAYER_RIGHT]
+
+class Inputs:
+    """
+    The player's input for a single tick.
+    """
+    def __init__(self, left=False, right=False, fire=False):
+        """
+        Create the input for a tick. left and right are the state of the
+        arrow keys and fire is True if the mouse button was pressed.
+        """
+        self.left = left
+        self.right = right
+        self.fire = fire
+
+NO_INPUT = Inputs()
+
+class Simulation:
+    """
+    The state and rules of a single game.
+    """
+    def __init__(self, god_mode=False, fps=FPS, seed=None, pixel_collision=False,
+                 swept_collision=False):
+        """
+        Create a new game. The game runs in simulated time, each tick
+        lasting 1/fps seconds, and timed events are measured in ticks. The
+        seed is used for the choices made when creating new balloons, and
+        one is chosen at random if it is None so that every game can be
+        replayed. If pixel_collision is True, sprites only collide where
+        their opaque pixels overlap rather than wherever their rects do. If
+        swept_collision is True, arrows hit the balloons that passed through
+        them during a tick, not just those that overlap them at the end of it.
+        """
+        self.god_mode = god_mode
+        self.pixel_collision = pixel_collision
+        self.swept_collision = swept_collision
+        self.fps = fps
+        self.scheduler = Scheduler()
+        self.random = random.Random()
+        # The position and velocity of every balloon.
+        self.balloon_store = BalloonStore(BALLOON_BOUNDS)
+        self.broadphase = Broadphase(self.balloon_store)
+        # Create sprites collections
+        self.balloons = pygame.sprite.Group()
+        # there's only ever one arrow on screen right now, but keeping the
+        # group in case I add powerups.
+        self.arrows = pygame.sprite.Group()
+        self.all_sprites = pygame.sprite.Group()
+        # Times the phases of each tick when the game is being profiled.
+        self.profiler = NULL_PROFILER
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """
+        Start a new game with the given seed, or a random one, reusing the
+        sprite groups and balloon store of the last game. The seed must be
+        an integer from 0 to MAX_SEED - 1.
+        """
+        if seed is None:
+            seed = random.getrandbits(32)
+        elif not isinstance(seed, int) or not 0 <= seed < MAX_SEED:
+            raise ValueError(f"seed must be an integer from 0 to {MAX_SEED - 1}, not {seed!r}")
+        self.seed = seed
+        self.random.seed(seed)
+        self.set_up()
+
+    def set_up(self):
+        """Repeatable set up at the beginning of a game."""
+        self.tick = 0
+        self.scheduler.clear()
+        self.sounds = [] # Sound cues emitted during the last tick.
+        # Remove the sprites of the last game, releasing their slots.
+        for sprite in self.all_sprites:
+            sprite.kill()
+        self.balloon_store.clear()
+        px, py = SCREEN_WIDTH / 2, STAGE_HEIGHT-28
+        self.player = Player(initial_x=px, initial_y=py, min_x=0, max_x=SCREEN_WIDTH)
+        self.make_freezer = True # whether the next balloon should be a freezer.
+        b1 = self.fresh_balloon(level_balloon=False)
+        self.balloons.add(b1)
+        self.all_sprites.add(b1, self.player)
+        self.frozen_balloons = False # Whether the balloons are frozen.
+        self.frozen_all = False # Whether all sprites are frozen.
+        # ten seconds from first balloon to second one, the interval decreases after that.
+        self.balloon_interval = INTERVAL_FRESH_BALLOON
+        # Set the event to add the next balloon.
+        self.set_timer(EVENT_ADD_BALLOON, self.balloon_interval)
+        self.popped_count = 0
+        self.balloon_count = 1
+        self.level = 1
+        self.lives = NUM_LIVES
+        self.invincible = False
+        self.player_visible = True
+        self.playing = True
+        self.won = False
+
+    def snapshot(self):
+        """
+        Return the complete state of the game as bytes, which restore can
+        return this or another simulation to. The settings of the game,
+        such as god mode, are not included.
+        """
+        store = self.balloon_store
+        _, random_state, gauss = self.random.getstate()
+        pending = self.scheduler.pending()
+        arrows = self.arrows.sprites()
+        slots = [b.slot for b in self.balloons]
+        player = self.player
+        flags = 0
+        for bit, name in enumerate(SNAPSHOT_FLAGS):
+            if getattr(self, name):
+                flags |= 1 << bit
+        parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                      self.tick, self.scheduler.tick, self.seed,
+                                      self.level, self.lives, self.balloon_count,
+                                      self.popped_count, self.balloon_interval, flags,
+                                      player.rect.centerx, player.rect.centery,
+                                      SNAPSHOT_PLAYER_STATES.index(player.state),
+                                      player.animate_tick, gauss is not None, gauss or 0.0,
+                                      len(arrows), len(pending), len(slots),
+                                      store.capacity, store.next_serial, len(store.free)),
+                 SNAPSHOT_RANDOM.pack(*random_state)]
+        parts.extend(SNAPSHOT_ARROW.pack(a.rect.centerx, a.rect.bottom, a.num_segments,
+                                         a.height, a.prev_top) for a in arrows)
+        parts.extend(SNAPSHOT_TIMER.pack(SNAPSHOT_EVENTS.index(event), remaining, interval)
+                     for event, (remaining, interval) in pending.items())
+        parts.append(struct.pack(f"<{len(slots)}q", *slots))
+        parts.append(store.snapshot())
+        return b"".join(parts)
+
+    def restore(self, data):
+        """
+        Return the game to the state saved in a snapshot.
+        """
+        (magic, version, tick, scheduler_tick, seed, level, lives, balloon_count,
+         popped_count, balloon_interval, flags, player_x, player_y, player_state,
+         animate_tick, has_gauss, gauss, num_arrows, num_timers, num_balloons,
+         capacity, next_serial, num_free) = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"Not a version {SNAPSHOT_VERSION} snapshot")
+        offset = SNAPSHOT_HEADER.size
+        self.random.setstate((3, SNAPSHOT_RANDOM.unpack_from(data, offset),
+                              gauss if has_gauss else None))
+        offset += SNAPSHOT_RANDOM.size
+        self.tick = tick
+        self.seed = seed
+        self.level = level
+        self.lives = lives
+        self.balloon_count = balloon_count
+        self.popped_count = popped_count
+        self.balloon_interval = balloon_interval
+        for bit, name in enumerate(SNAPSHOT_FLAGS):
+            setattr(self, name, bool(flags & (1 << bit)))
+        self.sounds = []
+        self.player.set_state(SNAPSHOT_PLAYER_STATES[player_state], animate_tick)
+        self.player.rect.center = (player_x, player_y)
+        # Replace the arrows and balloons, returning the current ones to
+        # their pools.
+        for sprite in self.balloons.sprites() + self.arrows.sprites():
+            sprite.kill()
+        for _ in range(num_arrows):
+            x, bottom, num_segments, height, prev_top = SNAPSHOT_ARROW.unpack_from(data, offset)
+            offset += SNAPSHOT_ARROW.size
+            a = Arrow.create(initial_x=x, initial_y=bottom)
+            a.restore(num_segments, height, prev_top)
+            self.arrows.add(a)
+            self.all_sprites.add(a)
+        pending = {}
+        for _ in range(num_timers):
+            event, remaining, interval = SNAPSHOT_TIMER.unpack_from(data, offset)
+            offset += SNAPSHOT_TIMER.size
+            pending[SNAPSHOT_EVENTS[event]] = (remaining, interval)
+        self.scheduler.restore(scheduler_tick, pending)
+        slots = struct.unpack_from(f"<{num_balloons}q", data, offset)
+        offset += num_balloons * 8
+        store = self.balloon_store
+        store.restore(data, offset, capacity, next_serial, num_free)
+        for slot in slots:
+            b = Balloon.from_slot(store, slot)
+            self.balloons.add(b)
+            self.all_sprites.add(b)
+        self.broadphase.rebuild()
+
+    def ticks(self, interval):
+        """
+        Convert an interval in ms to a whole number of ticks.
+        """
+        return max(1, round(interval * self.fps / 1000))
+
+    def set_timer(self, event, interval):
+        """
+        Repeatedly fire event every interval ms of simulated time, replacing
+        any existing timer for the event. An interval of 0 clears the timer.
+        """
+        if interval > 0:
+            self.scheduler.set_timer(event, self.ticks(interval))
+        else:
+            self.scheduler.cancel(event)
+
+    def state(self):
+        """
+        Return a summary of the game state.
+        """
+        return {'tick': self.tick,
+                'level': self.level,
+                'lives': self.lives,
+                'balloon_count': self.balloon_count,
+                'popped_count': self.popped_count,
+                'balloons': len(self.balloons),
+                'arrows': len(self.arrows),
+                'player_x': self.player.rect.centerx,
+                'frozen_balloons': self.frozen_balloons,
+                'frozen_all': self.frozen_all,
+                'invincible': self.invincible,
+                'playing': self.playing,
+                'won': self.won,
+                'sounds': self.sounds}
+
+    def step(self, inputs=NO_INPUT):
+        """
+        Advance the game by one tick using the player's inputs and return
+        the new state.
+        """
+        self.sounds = []
+        if not self.playing:
+            return self.state()
+        self.tick += 1
+        profiler = self.profiler
+        profiler.mark()
+
+        # is there an arrow on screen?
+        if inputs.fire and len(self.arrows) == 0:
+            self.player.firing(is_firing=True)
+            self.fire_arrow()
+            self.sounds.append(SOUND_FIRE)
+
+        for event in self.scheduler.advance():
+            self.handle_event(event)
+        profiler.lap(PHASE_TIMERS)
+
+        self.move_sprites(inputs)
+        self.broadphase.rebuild()
+        profiler.lap(PHASE_MOVE)
+
+        # Collision detection for player and balloons.
+        if not self.invincible and not (self.frozen_all or self.frozen_balloons) and not self.god_mode:
+            if self.player_hit():
+                self.sounds.append(SOUND_OW)
+                self.lives -= 1
+                if self.lives < 1:
+                    # end game
+                    self.playing = False
+                else:
+                    self.frozen_all = True
+                    self.set_timer(EVENT_UNFREEZE, INTERVAL_FREEZE_LOST_LIFE)
+                    self.set_timer(EVENT_BLINK_PLAYER, INTERVAL_BLINK_PLAYER)
+        profiler.lap(PHASE_PLAYER_COLLISION)
+
+        if not self.frozen_all:
+            # Collision detection for arrows and balloons.
+            self.collide_arrows_balloons()
+        profiler.lap(PHASE_ARROW_COLLISION)
+        # Player won the game.
+        if len(self.balloons) == 0 and self.balloon_count == TOTAL_BALLOONS:
+            self.won = True
+            self.playing = False
+
+        new_level = int(self.balloon_count / 10) + 1
+        if new_level > self.level and new_level <= 10:
+            self.level = new_level
+        return self.state()
+
+    def handle_event(self, event):
+        """
+        Handle a timed event.
+        """
+        if event == EVENT_ADD_BALLOON:
+            self.balloon_count += 1
+            new_level_target = int(self.balloon_count / 10) + 1
+            if new_level_target > 10:
+                # End of level 10, clear timer
+                self.set_timer(EVENT_ADD_BALLOON, 0)
+            else:
+                end_of_level = new_level_target > self.level
+                b = self.fresh_balloon(level_balloon=end_of_level)
+                self.balloons.add(b)
+                self.all_sprites.add(b)
+                if end_of_level:
+                    # Decrement the time between balloons.
+                    self.balloon_interval = INTERVAL_FRESH_BALLOON - (new_level_target * 100)
+                    self.set_timer(EVENT_ADD_BALLOON, max(800, self.balloon_interval))
+        elif event == EVENT_EXPLODE:
+            self.explode_one_level()
+        elif event == EVENT_UNFREEZE:
+            self.frozen_balloons = False
+            if self.frozen_all:
+                # player lost a life, make them invincible for a time
+                self.invincible = True
+                self.set_timer(EVENT_INVINCIBILITY, INTERVAL_INVINCIBILITY)
+                self.frozen_all = False
+        elif event == EVENT_FRESH_BALLOON_WAIT:
+            # Allow new balloons to start moving and be popped.
+            self.balloon_store.waiting[:] = False
+        elif event == EVENT_INVINCIBILITY:
+            self.invincible = False
+            self.player_visible = True
+            self.set_timer(EVENT_INVINCIBILITY, 0)
+            self.set_timer(EVENT_BLINK_PLAYER, 0)
+        elif event == EVENT_BLINK_PLAYER:
+            self.player_visible = not self.player_visible
+
+    def fresh_balloon(self, level_balloon=False):
+        """ Make a new, full-size balloon. It appears in either the upper-right or
+        upper-left corner. Every other balloon is a freezer, which means that
+        one of its size 1 balloons will create a short freeze event when popped.
+        If level_balloon is True, create a special balloon that
+        either clears the screen or creates a long freeze event when popped.
+        """
+        self.make_freezer = not self.make_freezer
+        x_dir = self.random.choice([-1, 1]) # Random left or right
+        initial_x = 0 if x_dir == 1 else SCREEN_WIDTH - 40
+        initial_y, initial_vy = 0, 0
+        self.set_timer(EVENT_FRESH_BALLOON_WAIT, INTERVAL_FRESH_BALLOON_WAIT)
+        return Balloon.create(size=5,
+                              initial_x=initial_x,
+                              initial_y=initial_y,
+                              x_dir=x_dir,
+                              vy=initial_vy,
+                              bounds=BALLOON_BOUNDS,
+                              level_balloon=level_balloon,
+                              freezer=self.make_freezer,
+                              store=self.balloon_store)
+
+    def explode_balloons(self):
+        """ Freeze balloons and explode them on a timer."""
+        self.frozen_balloons = True
+        self.set_timer(EVENT_EXPLODE, INTERVAL_EXPLODE)
+
+    def explode_one_level(self):
+        """
+        Handle the explosion of balloons.
+        """
+        # Pop all balloons, replacing the ones whose size is greater
+        # than one with two children.
+        if len(self.balloons) > 0:
+            new_balloons = []
+            added_children = False
+            for b in self.balloons:
+                if not b.waiting:
+                    if b.size > 1:
+                        vy = -INITIAL_SPEED_Y / 2
+                        size = b.size - 1
+                        initial_y = b.rect.centery
+                        offset = (b.rect.centerx - b.rect.left) / 2
+                        c1 = Balloon.create(size=size,
+                                            initial_x=b.rect.centerx - offset,
+                                            initial_y=initial_y,
+                                            x_dir=-1,
+                                            vy=vy,
+                                            bounds=BALLOON_BOUNDS,
+                                            store=self.balloon_store)
+                        c2 = Balloon.create(size=size,
+                                            initial_x=b.rect.centerx + offset,
+                                            initial_y=initial_y,
+                                            x_dir=1,
+                                            vy=vy,
+                                            bounds=BALLOON_BOUNDS,
+                                            store=self.balloon_store)
+                        new_balloons.append(c1)
+                        new_balloons.append(c2)
+                        added_children = True
+                    b.kill()
+                    self.sounds.append(SOUND_POP)
+                    self.popped_count += 1
+            for b in new_balloons:
+                self.balloons.add(b)
+                self.all_sprites.add(b)
+            if not added_children:
+                # There may still be balloons in the group but they are waiting.
+                self.frozen_balloons = False
+                self.set_timer(EVENT_EXPLODE, 0)
+        else:
+            # We have popped all of the balloons, unfreeze and clear
+            # the timer.
+            self.frozen_balloons = False
+            self.set_timer(EVENT_EXPLODE, 0)
+
+    def freeze_balloons(self, interval):
+        """ Freeze balloons."""
+        self.frozen_balloons = True
+        self.set_timer(EVENT_UNFREEZE, interval)
+
+    def freeze_all(self, interval):
+        """ Freeze all entities."""
+        self.frozen_all = True
+        self.set_timer(EVENT_UNFREEZE, interval)
+
+    def move_sprites(self, inputs):
+        """ Move the sprites. """
+        if not self.frozen_all:
+            # Move the player and arrows.
+            self.player.move(inputs.left, inputs.right)
+            for arrow in self.arrows:
+                arrow.move()
+            if not self.frozen_balloons:
+                # Move all balloons that are not waiting in one step.
+                self.balloon_store.step()
+                return
+        self.balloon_store.hold()
+
+    def fire_arrow(self):
+        """
+        Add an Arrow sprite.
+        """
+        a_x = self.player.rect.centerx
+        a_y = STAGE_HEIGHT - 20
+        a = Arrow.create(initial_x=a_x, initial_y=a_y)
+        self.arrows.add(a)
+        self.all_sprites.add(a)
+
+    def player_hit(self) -> bool:
+        """
+        Check for a collision between the player and a balloon.
+        """
+        return len(self.collide(self.player)) > 0
+
+    def collide(self, sprite):
+        """
+        Return the balloons that collide with sprite, in the order they were
+        added. The broadphase finds the balloons whose rects overlap the
+        sprite's, and only those are tested against the masks.
+        """
+        balloons = self.broadphase.collide(sprite)
+        if self.pixel_collision:
+            balloons = [b for b in balloons if pygame.sprite.collide_mask(sprite, b)]
+        return balloons
+
+    def collide_swept(self, arrow):
+        """
+        Return the balloons that passed through arrow during the last tick, in
+        the order they touched it. With pixel collision, balloons that overlap
+        the arrow at the end of the tick must also overlap its mask.
+        """
+        owners = self.balloon_store.owners
+        balloons = [owners[slot] for slot in self.broadphase.sweep(arrow.rect, arrow.prev_top)]
+        if self.pixel_collision:
+            balloons = [b for b in balloons
+                        if not b.rect.colliderect(arrow.rect) or
+                        pygame.sprite.collide_mask(arrow, b)]
+        return balloons
+
+    def collide_arrows_balloons(self):
+        """
+        Check for collisions between arrows and balloons. Regular balloons with a size
+        greater than 1 are replaced with two "child" balloons whose size is one less
+        than their parent. Level balloons are either Star balloons, which cause all
+        other balloons to explode, or Clock balloons, which initiate a long freeze.
+        Some size 1 balloons are freezers, which initiate a short freeze.
+        """
+        # Each arrow hits the first balloon it collides with and is removed.
+        hit_balloons = {}
+        for arrow in self.arrows:
+            if self.swept_collision:
+                balloons = self.collide_swept(arrow)
+            else:
+                balloons = self.collide(arrow)
+            if len(balloons) > 0:
+                hit_balloons[balloons[0]] = self.balloon_store.serial[balloons[0].slot]
+                arrow.kill()
+        for b in sorted(hit_balloons, key=hit_balloons.get):
+            # The balloon was hit by one or more arrows.
+            # If b is a level balloon, explode all other balloons or begin
+            # a long freeze event.
+            if b.level_balloon:
+                if b.star:
+                    self.explode_balloons()
+                else:
+                    self.freeze_balloons(INTERVAL_FREEZE_CLOCK)
+            elif b.size > 1 and not b.waiting:
+                # Replace the balloon with two smaller ones.
+                vy = 0 if b.rect.top < 20 else -INITIAL_SPEED_Y / 2
+                size = b.size - 1
+                initial_y = b.rect.centery
+                offset = (b.rect.centerx - b.rect.left) / 2
+                c1 = Balloon.create(size=size,
+                                    initial_x=b.rect.centerx - offset,
+                                    initial_y=initial_y,
+                                    x_dir=-1,
+                                    vy=vy,
+                                    bounds=BALLOON_BOUNDS,
+                                    freezer=b.freezer,
+                                    store=self.balloon_store)
+                c2 = Balloon.create(size=size,
+                                    initial_x=b.rect.centerx + offset,
+                                    initial_y=initial_y,
+                                    x_dir=1,
+                                    vy=vy,
+                                    bounds=BALLOON_BOUNDS,
+                                    freezer=False,
+                                    store=self.balloon_store)
+                self.balloons.add(c1, c2)
+                self.all_sprites.add(c1, c2)
+            elif b.size == 1 and b.freezer:
+                # The balloon is a size 1 freezer.
+                self.freeze_balloons(INTERVAL_FREEZE_BALLOON)
+            if not b.waiting:
+                # For every type of balloon except on which is waiting,
+                # play the sound effect and remove the balloon.
+                if b.level_balloon:
+                    self.sounds.append(SOUND_LEVEL)
+                else:
+                    self.sounds.append(SOUND_POP)
+                b.kill()
+                self.popped_count += 1
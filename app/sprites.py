@@ -2,100 +2,157 @@
 Sprites for the game.
 """
 import pygame
-import pygame.locals as pl
-import os
+import assets
+from physics import (BalloonStore, INITIAL_SPEED_X, INITIAL_SPEED_Y, FLAG_LEVEL, FLAG_STAR,
+                     FLAG_FREEZER)
 
 # Physics Constants
-# Vertical acceleration due to gravity. The higher this value, the faster the arc.
-GRAVITY = 0.5 
-# Initial horizontal speed (constant).
-INITIAL_SPEED_X = 3
-# Initial vertical speed (upwards) when the balloon is created or bounces.
-INITIAL_SPEED_Y = 20
 # Speed of the arrows
 ARROW_SPEED = 5
+# Number of segments in the strip that arrow images are cut from, enough
+# for an arrow to reach the top of the stage.
+ARROW_STRIP_SEGMENTS = 16
 
-# Paths to assets
-ASSETS_PATH = "assets"
-IMAGES_PATH = os.path.join(ASSETS_PATH, "images")
-AUDIO_PATH = os.path.join(ASSETS_PATH, "audio")
-IMAGE_PLAYER_STANDING = pygame.image.load(os.path.join(IMAGES_PATH, "player_standing.png"))
-IMAGE_PLAYER_FIRING = pygame.image.load(os.path.join(IMAGES_PATH, "player_firing.png"))
-IMAGE_PLAYER_LEFT_0 = pygame.image.load(os.path.join(IMAGES_PATH, "player_left_0.png"))
-
-IMAGE_ARROW_HEAD = pygame.image.load(os.path.join(IMAGES_PATH, "arrow_head.png"))
-IMAGE_ARROW_TAIL = pygame.image.load(os.path.join(IMAGES_PATH, "arrow_tail.png"))
-
-IMAGE_BALLOON_5 = pygame.image.load(os.path.join(IMAGES_PATH, "balloon_5.png"))
-IMAGE_BALLOON_4 = pygame.image.load(os.path.join(IMAGES_PATH, "balloon_4.png"))
-IMAGE_BALLOON_3 = pygame.image.load(os.path.join(IMAGES_PATH, "balloon_3.png"))
-IMAGE_BALLOON_2 = pygame.image.load(os.path.join(IMAGES_PATH, "balloon_2.png"))
-IMAGE_BALLOON_1 = pygame.image.load(os.path.join(IMAGES_PATH, "balloon_1.png"))
-BALLOONS = {1: IMAGE_BALLOON_1,
-            2: IMAGE_BALLOON_2,
-            3: IMAGE_BALLOON_3,
-            4: IMAGE_BALLOON_4,
-            5: IMAGE_BALLOON_5}
-IMAGE_BALLOON_FREEZE = pygame.image.load(os.path.join(IMAGES_PATH, "balloon_1_freeze.png")) 
-IMAGE_BALLOON_STAR = pygame.image.load(os.path.join(IMAGES_PATH, "balloon_star.png"))
-IMAGE_BALLOON_CLOCK = pygame.image.load(os.path.join(IMAGES_PATH, "balloon_clock.png"))
+# Animation states of the player.
+PLAYER_STANDING = "standing"
+PLAYER_FIRING = "firing"
+PLAYER_LEFT = "left"
+PLAYER_RIGHT = "right"
+# The frames of the player's walk cycle, facing left. Walking right uses
+# the same frames flipped.
+PLAYER_WALK_FRAMES = ["player_left_0", "player_left_1", "player_left_2", "player_left_3"]
+# Ticks that each frame of the walk cycle is shown for.
+PLAYER_WALK_TICKS = 3
+# Ticks that the player stays in the firing pose after firing, unless it moves.
+PLAYER_FIRING_TICKS = 10
 
 class Player(pygame.sprite.Sprite):
-    """ The player sprite."""
+    """
+    The player sprite. Its images are taken from a table of frames that is
+    built once, and it moves through them with its own timer.
+    """
+    frames = {} # The (image, mask) frames of each animation state.
+    frames_source = None # The standing image the table was built from.
+
     def __init__(self, initial_x, initial_y, min_x, max_x):
         """
         Create a new Player with the initial coordinates and that can move in the
         given bounds.
         """ 
         super().__init__() 
-        self.image = IMAGE_PLAYER_STANDING
+        self.image, self.mask = Player.frame_table()[PLAYER_STANDING][0]
         self.rect = self.image.get_rect()
         self.rect.center = (initial_x, initial_y)
         self.min_x = min_x
         self.max_x = max_x
         self.is_firing = False
-        self.animate_tick = 0
+        self.state = PLAYER_STANDING
+        self.animate_tick = 0 # Ticks since the state last changed.
  
-    def move(self):
+    def move(self, left=False, right=False):
         """
-        Move the sprite if the left or right arrow key is pressed. Also changes
-        the image depending on the direction the player is moving in. 
+        Move the sprite if the left or right arrow key is pressed, and advance
+        its animation by a tick. The player walks while moving, stays in the
+        firing pose for a while after firing and otherwise stands still.
         """
-        pressed_keys = pygame.key.get_pressed()
-        if pressed_keys[pl.K_LEFT] or pressed_keys[pl.K_RIGHT]:
-            image = IMAGE_PLAYER_STANDING
-            if pressed_keys[pl.K_LEFT] and self.rect.left > self.min_x:
-                self.rect.move_ip(-8, 0)
-                image = IMAGE_PLAYER_LEFT_0
-            elif pressed_keys[pl.K_RIGHT] and self.rect.right < self.max_x:        
-                self.rect.move_ip(8, 0)
-                image = pygame.transform.flip(IMAGE_PLAYER_LEFT_0, flip_x=True, flip_y=False)
-            self.set_image(image)
+        if left and self.rect.left > self.min_x:
+            self.rect.move_ip(-8, 0)
+            self.animate(PLAYER_LEFT)
+        elif right and self.rect.right < self.max_x:
+            self.rect.move_ip(8, 0)
+            self.animate(PLAYER_RIGHT)
+        elif self.state == PLAYER_FIRING and self.animate_tick < PLAYER_FIRING_TICKS:
+            self.animate(PLAYER_FIRING)
+        else:
+            self.animate(PLAYER_STANDING)
 
     def firing(self, is_firing):
         """
         Switch the image when the player is firing.
         """
-        self.is_firing = is_firing
-        if is_firing:
-            self.set_image(IMAGE_PLAYER_FIRING)
+        self.animate(PLAYER_FIRING if is_firing else PLAYER_STANDING, restart=True)
+
+    def animate(self, state, restart=False):
+        """
+        Show the frame for a tick in the given state, starting from the first
+        frame of the state if it has changed or restart is True.
+        """
+        if state == self.state and not restart:
+            self.set_state(state, self.animate_tick + 1)
         else:
-            self.set_image(IMAGE_PLAYER_STANDING)
+            self.set_state(state, 0)
 
-    def set_image(self, image):
+    def set_state(self, state, animate_tick):
         """
-        Change the image used to represent the sprite.
+        Show the frame of a state the given number of ticks after the state
+        began.
+        """
+        self.state = state
+        self.animate_tick = animate_tick
+        self.is_firing = state == PLAYER_FIRING
+        frames = Player.frame_table()[state]
+        image, mask = frames[animate_tick // PLAYER_WALK_TICKS % len(frames)]
+        if image is not self.image:
+            self.set_image(image, mask)
+
+    def set_image(self, image, mask):
+        """
+        Change the image used to represent the sprite, and its collision mask.
         """
         x,y = self.rect.centerx, self.rect.centery
         self.image = image
-        self.rect = self.image.get_rect()
+        self.mask = mask
+        self.rect.size = image.get_size()
         self.rect.center = (x, y)
-        
+
+    @classmethod
+    def frame_table(cls):
+        """
+        Return the frames of each animation state, building them the first
+        time and again if the images have been converted since.
+        """
+        if cls.frames_source is not assets.image("player_standing"):
+            cls.frames = {
+                PLAYER_STANDING: [(assets.image("player_standing"), assets.mask("player_standing"))],
+                PLAYER_FIRING: [(assets.image("player_firing"), assets.mask("player_firing"))],
+                PLAYER_LEFT: [(assets.image(name), assets.mask(name))
+                              for name in PLAYER_WALK_FRAMES],
+                PLAYER_RIGHT: [(pygame.transform.flip(assets.image(name), flip_x=True, flip_y=False),
+                                assets.mask(name, flip_x=True))
+                               for name in PLAYER_WALK_FRAMES],
+            }
+            cls.frames_source = assets.image("player_standing")
+        return cls.frames
+
+def balloon_image(size, level_balloon, freezer, star=True):
+    """
+    Return the name of the image of a balloon.
+    """
+    if level_balloon:
+        return "balloon_star" if star else "balloon_clock"
+    if size == 1 and freezer:
+        return "balloon_freeze"
+    return f"balloon_{size}"
+
+def stored(name):
+    """
+    A balloon attribute whose value is kept in the named array of the
+    balloon's store.
+    """
+    def get(self):
+        return getattr(self.store, name)[self.slot]
+    def set(self, value):
+        getattr(self.store, name)[self.slot] = value
+    return property(get, set)
 
 class Balloon(pygame.sprite.Sprite):
     """
-    Class for the Balloon sprite.
+    Class for the Balloon sprite. Balloons that have been killed are kept
+    in a pool and reused by create, so that popping balloons does not
+    allocate new sprites.
     """
+    pool = [] # Killed balloons, ready to be reset.
+
     def __init__(self,
                  size,
                  initial_x,
@@ -104,96 +161,218 @@ class Balloon(pygame.sprite.Sprite):
                  vy,
                  bounds,
                  level_balloon=False,
-                 freezer=False):
+                 freezer=False,
+                 store=None):
         """
-        Create a new balloon sprite with the given attributes.
+        Create a new balloon sprite with the given attributes. The position,
+        velocity and flags of the balloon are kept in store, a BalloonStore
+        shared with other balloons, so that they can all be moved at once.
         """
         super().__init__()
+        self.rect = pygame.Rect(0, 0, 0, 0) # Resized in place when the balloon is reset.
+        self.reset(size, initial_x, initial_y, x_dir, vy, bounds,
+                   level_balloon, freezer, store)
+
+    @classmethod
+    def create(cls,
+               size,
+               initial_x,
+               initial_y,
+               x_dir,
+               vy,
+               bounds,
+               level_balloon=False,
+               freezer=False,
+               store=None):
+        """
+        Return a balloon with the given attributes, reusing one from the pool
+        if there is one.
+        """
+        if not cls.pool:
+            return cls(size, initial_x, initial_y, x_dir, vy, bounds,
+                       level_balloon, freezer, store)
+        b = cls.pool.pop()
+        b.reset(size, initial_x, initial_y, x_dir, vy, bounds,
+                level_balloon, freezer, store)
+        return b
+
+    def reset(self,
+              size,
+              initial_x,
+              initial_y,
+              x_dir,
+              vy,
+              bounds,
+              level_balloon=False,
+              freezer=False,
+              store=None):
+        """
+        Give the balloon the given attributes, as if it had just been created.
+        """
         self.size = size
-        if level_balloon:
-            image = IMAGE_BALLOON_STAR
-        elif size == 1 and freezer:
-            image = IMAGE_BALLOON_FREEZE
-        else:
-            image = BALLOONS[size]
-        self.image = image
-        self.rect = self.image.get_rect()
+        name = balloon_image(size, level_balloon, freezer)
+        self.image = assets.image(name)
+        self.mask = assets.mask(name)
+        self.rect.size = self.image.get_size()
         self.rect.center=(initial_x, initial_y)
-        # Velocities (float for smooth movement)
-        self.vx = INITIAL_SPEED_X * x_dir
-        self.vy = vy        
-        self.x = float(self.rect.x)
-        self.y = float(self.rect.y)
         self.bounds = bounds
         self.level_balloon = level_balloon
-        self.star = True # flip between star and clock on each bounce
         self.freezer=freezer
         self.flash_off = True
-        self.waiting = size == 5
+        flags = FLAG_STAR # flip between star and clock on each bounce
+        if level_balloon:
+            flags |= FLAG_LEVEL
+        if freezer:
+            flags |= FLAG_FREEZER
+        self.store = store if store is not None else BalloonStore(bounds, capacity=1)
+        # Velocities (float for smooth movement)
+        self.slot = self.store.add(self,
+                                   x=float(self.rect.x),
+                                   y=float(self.rect.y),
+                                   vx=INITIAL_SPEED_X * x_dir,
+                                   vy=vy,
+                                   w=self.rect.width,
+                                   h=self.rect.height,
+                                   size=size,
+                                   flags=flags,
+                                   waiting=size == 5)
 
-    def level_balloon_flip(self):
+    @classmethod
+    def from_slot(cls, store, slot):
         """
-        Toggle the image for level balloons.
+        Return a balloon for the state already held in a slot of store, such
+        as one restored from a snapshot, reusing one from the pool if there
+        is one.
         """
-        if self.star:
-            self.image = IMAGE_BALLOON_CLOCK
-            self.star = False
+        if cls.pool:
+            b = cls.pool.pop()
         else:
-            self.image = IMAGE_BALLOON_STAR
-            self.star = True
-          
-    def move(self):
+            b = cls.__new__(cls)
+            pygame.sprite.Sprite.__init__(b)
+            b.rect = pygame.Rect(0, 0, 0, 0)
+        flags = int(store.flags[slot])
+        b.size = int(store.size[slot])
+        b.level_balloon = bool(flags & FLAG_LEVEL)
+        b.freezer = bool(flags & FLAG_FREEZER)
+        name = balloon_image(b.size, b.level_balloon, b.freezer, bool(flags & FLAG_STAR))
+        b.image = assets.image(name)
+        b.mask = assets.mask(name)
+        b.rect.size = b.image.get_size()
+        b.rect.topleft = (int(store.x[slot]), int(store.y[slot]))
+        b.bounds = store.bounds
+        b.flash_off = True
+        b.store = store
+        b.slot = slot
+        store.owners[slot] = b
+        return b
+
+    # The physics state of the balloon lives in its store.
+    x = stored('x')
+    y = stored('y')
+    vx = stored('vx')
+    vy = stored('vy')
+    waiting = stored('waiting')
+
+    @property
+    def star(self):
+        """ Whether a level balloon is showing the star rather than the clock. """
+        return bool(self.store.flags[self.slot] & FLAG_STAR)
+
+    def kill(self):
+        """
+        Remove the balloon from all groups, release its slot in the store and
+        return it to the pool.
         """
-        Move the sprite.
-        """
-        # Apply Gravity (Acceleration): This creates the arc motion.
-        # Vertical velocity is constantly increasing (downwards)
-        self.vy += GRAVITY
-        
-        # Update Position: Use float positions, then sync with rect
-        self.x += self.vx
-        self.y += self.vy
-        
-        # Handle Wall Collisions (Horizontal Bounce)
-        if self.rect.left <= self.bounds['min_x']:
-            self.vx *= -1 # Reverse horizontal direction
-            self.x = 1 # Prevent sticking to the wall
-        elif self.rect.right >= self.bounds['max_x']:
-            self.vx *= -1 # Reverse horizontal direction
-            self.x = self.bounds['max_x'] - self.rect.width - 1 # Prevent sticking
-        # Handle Floor Collision (Vertical Bounce)
-        if self.y >= self.bounds['max_y'] - self.rect.height:
-            self.vy = -INITIAL_SPEED_Y  
-            self.y = self.bounds['max_y'] - self.rect.height # Prevent falling through the floor
-            if self.level_balloon:
-                self.level_balloon_flip()
-        
-        # Sync Rect position with float position
-        self.rect.x = int(self.x)
-        self.rect.y = int(self.y)
+        super().kill()
+        if self.slot is not None:
+            self.store.remove(self.slot)
+            self.slot = None
+            Balloon.pool.append(self)
+
+    def update_image(self):
+        """
+        Show the star or clock image of a level balloon.
+        """
+        name = "balloon_star" if self.star else "balloon_clock"
+        self.image = assets.image(name)
+        self.mask = assets.mask(name)
 
 class Arrow(pygame.sprite.Sprite):
     """
     Class for the arrow sprite.
     """
+    # The images for every number of segments are subsurfaces of one tall
+    # strip, which is built the first time an arrow is needed.
+    strip = None
+    strip_head = None # The head image the strip was built from.
+    images = [] # The image for each number of segments.
+    masks = [] # The collision mask of each image.
+    pool = [] # Killed arrows, ready to be reset.
+
     def __init__(self, initial_x, initial_y):
         """
         Create an new Arrow sprite.
         """
         super().__init__()
+        self.rect = pygame.Rect(0, 0, 0, 0) # Resized in place as the arrow grows.
+        self.reset(initial_x, initial_y)
+
+    @classmethod
+    def create(cls, initial_x, initial_y):
+        """
+        Return an arrow at the given position, reusing one from the pool if
+        there is one.
+        """
+        if not cls.pool:
+            return cls(initial_x, initial_y)
+        a = cls.pool.pop()
+        a.reset(initial_x, initial_y)
+        return a
+
+    def reset(self, initial_x, initial_y):
+        """
+        Put the arrow back at the given position, as if it had just been
+        created.
+        """
         self.num_segments = 2
-        self.image = self.build_arrow()
-        self.rect = self.image.get_rect()
+        self.image = Arrow.arrow_image(self.num_segments)
+        self.mask = Arrow.masks[self.num_segments]
+        self.rect.size = self.image.get_size()
         self.rect.centerx = initial_x
         self.rect.bottom = initial_y
+        self.prev_top = self.rect.top # The top of the arrow before the last tick.
         self.speed = ARROW_SPEED
-        self.segment_height = IMAGE_ARROW_TAIL.get_rect().height
+        self.segment_height = assets.image("arrow_tail").get_height()
         self.height = self.segment_height * 3
- 
+
+    def restore(self, num_segments, height, prev_top):
+        """
+        Give the arrow a length and earlier position saved in a snapshot,
+        keeping its centre and bottom.
+        """
+        x, bottom = self.rect.centerx, self.rect.bottom
+        self.num_segments = num_segments
+        self.image = Arrow.arrow_image(num_segments)
+        self.mask = Arrow.masks[num_segments]
+        self.rect.size = self.image.get_size()
+        self.rect.centerx = x
+        self.rect.bottom = bottom
+        self.height = height
+        self.prev_top = prev_top
+
+    def kill(self):
+        """
+        Remove the arrow from all groups and return it to the pool.
+        """
+        if self.alive():
+            super().kill()
+            Arrow.pool.append(self)
+
     def move(self):
         """
         Move the sprite, removing it when it reaches the top of the screen.
         """
+        self.prev_top = self.rect.top
         if self.rect.top > 0:
             self.height += self.speed
             self.grow()
@@ -207,31 +386,54 @@ class Arrow(pygame.sprite.Sprite):
         if self.height / self.num_segments > self.num_segments + 1:
             self.num_segments += 1
             old_bottom = self.rect.bottom
-            self.image = self.build_arrow()
-            self.rect = self.image.get_rect(centerx=self.rect.centerx, bottom=old_bottom)
+            self.image = Arrow.arrow_image(self.num_segments)
+            self.mask = Arrow.masks[self.num_segments]
+            x = self.rect.centerx
+            self.rect.size = self.image.get_size()
+            self.rect.centerx = x
+            self.rect.bottom = old_bottom
+
+    @classmethod
+    def arrow_image(cls, num_segments):
+        """
+        Return the image of an arrow with the given number of tail segments.
+        """
+        if cls.strip_head is not assets.image("arrow_head"):
+            # The images have been converted since the strip was built.
+            cls.build_strip(ARROW_STRIP_SEGMENTS)
+        elif num_segments >= len(cls.images):
+            cls.build_strip(2 * num_segments)
+        return cls.images[num_segments]
 
-    def build_arrow(self):
+    @classmethod
+    def build_strip(cls, max_segments):
         """
-        Combines the head surface and repeated tail segments into a single,
-        composite object.
+        Combines the head surface and max_segments repeated tail segments into
+        a single strip. The image of an arrow with n segments is the top of
+        the strip, from the head down to the nth segment.
         """
         # Get dimensions
-        head_h = IMAGE_ARROW_HEAD.get_height()
-        tail_h = IMAGE_ARROW_TAIL.get_height()
-        width = IMAGE_ARROW_HEAD.get_width() # Assume head and tail have the same width
+        head = assets.image("arrow_head")
+        tail = assets.image("arrow_tail")
+        head_h = head.get_height()
+        tail_h = tail.get_height()
+        width = head.get_width() # Assume head and tail have the same width
 
-        total_height = head_h + (self.num_segments * tail_h)
+        total_height = head_h + (max_segments * tail_h)
     
         # Create the new, empty surface
-        arrow_surf = pygame.Surface((width, total_height), pygame.SRCALPHA)
-    
-        # 4. Blit the tail segments (starting from the bottom of the arrow)
-        y_offset = total_height - tail_h 
+        strip = pygame.Surface((width, total_height), pygame.SRCALPHA)
+        if pygame.display.get_surface() is not None:
+            strip = strip.convert_alpha()
+            strip.fill((0, 0, 0, 0))
 
-        for i in range(self.num_segments):
-            arrow_surf.blit(IMAGE_ARROW_TAIL, (0, y_offset - (i * tail_h)))
-    
-        # Blit the arrow head at the very top (y=0)
-        arrow_surf.blit(IMAGE_ARROW_HEAD, (0, 0))
-    
-        return arrow_surf
+        # Blit the arrow head at the very top (y=0) and the tail segments below it.
+        strip.blit(head, (0, 0))
+        for i in range(max_segments):
+            strip.blit(tail, (0, head_h + (i * tail_h)))
+
+        cls.strip = strip
+        cls.strip_head = head
+        cls.images = [strip.subsurface((0, 0, width, head_h + (n * tail_h)))
+                      for n in range(max_segments + 1)]
+        cls.masks = [pygame.mask.from_surface(image) for image in cls.images]
@@ -4,363 +4,427 @@ Superpang game using pygame.
 import pygame
 import pygame.locals as pl
 import sys
-import random
 import os
-from sprites import Player, Balloon, Arrow, INITIAL_SPEED_Y, AUDIO_PATH, ASSETS_PATH, IMAGES_PATH
+import time
+import assets
+import audio
+from audio import SoundManager
+from assets import Backgrounds, convert_images
+from scheduler import Scheduler
+from interpolation import Interpolator
+from replay import Recording
+from profiler import (Profiler, Overlay, NULL_PROFILER, PHASE_EVENTS, PHASE_WAIT,
+                      PHASE_BACKGROUND, PHASE_SPRITES, PHASE_HUD, PHASE_UPDATE)
+from hud import Hud, TextCache, RED, BLACK, WHITE, GOLD, PROGRESS_BALLOONS
+from simulation import Simulation, Inputs, FPS, SCREEN_WIDTH, SCREEN_HEIGHT, STAGE_HEIGHT
 
-pygame.init()
-
-FPS = 30
-clock = pygame.time.Clock()
+# Events.
+EVENT_PAUSE_LABEL_FLASH = "pause_label_flash" # Flash the "PAUSED" label.
 
-# Screen information
-SCREEN_WIDTH = 800
-SCREEN_HEIGHT = 600
-STAGE_HEIGHT = 560
-SPEED = 5
+# Intervals between events, in ms.
+INTERVAL_PAUSE_LABEL_FLASH = 800
 
-# Predefine some colors
-RED   = (255, 0, 0)
-BLACK = (0, 0, 0)
-WHITE = (255, 255, 255)
-GOLD = (255, 215, 0)
+# The most time a single frame can add to the simulation, in ms. After a
+# longer stall the game slows down rather than running many ticks at once.
+MAX_FRAME_MS = 250
 
-SURF = pygame.display.set_mode((SCREEN_WIDTH,SCREEN_HEIGHT))
-pygame.display.set_caption("SuperPang!")
+# Session states.
+STATE_TITLE = "title"
+STATE_PLAYING = "playing"
+STATE_GAME_OVER = "game_over"
+STATE_WON = "won"
+STATE_QUIT = "quit"
 
-NUM_LIVES = 3
-IMAGE_PLAYER_LIFE = pygame.image.load(os.path.join(IMAGES_PATH, "player_life.png"))
+# The longest it should take from creating the game to showing the first
+# frame, in ms.
+STARTUP_BUDGET_MS = 1000
 
-# Events.
-EVENT_ADD_BALLOON = pygame.event.custom_type() # Add a new balloon.
-EVENT_EXPLODE = pygame.event.custom_type() # Explode one level of balloons.
-EVENT_UNFREEZE = pygame.event.custom_type() # Unfreeze entities.
-EVENT_FRESH_BALLOON_WAIT = pygame.event.custom_type() # End the waiting period of new balloons.
-EVENT_PAUSE_LABEL_FLASH = pygame.event.custom_type() # Flash the "PAUSED" label.
-EVENT_INVINCIBILITY = pygame.event.custom_type() # Player can't be harmed.
-EVENT_BLINK_PLAYER = pygame.event.custom_type() # Flash Player icon.
+# Areas of the screen for the stage and the HUD.
+STAGE_RECT = pygame.Rect(0, 0, SCREEN_WIDTH, STAGE_HEIGHT)
+HUD_RECT = pygame.Rect(0, STAGE_HEIGHT, SCREEN_WIDTH, SCREEN_HEIGHT-STAGE_HEIGHT)
 
-# Intervals between events, in ms.
-INTERVAL_FRESH_BALLOON = 20000
-INTERVAL_FRESH_BALLOON_WAIT = 2000 
-INTERVAL_FREEZE_CLOCK = 4000
-INTERVAL_FREEZE_BALLOON = 2000
-INTERVAL_FREEZE_LOST_LIFE = 1500
-INTERVAL_EXPLODE = 500
-INTERVAL_PAUSE_LABEL_FLASH = 800
-INTERVAL_INVINCIBILITY = 5000
-INTERVAL_BLINK_PLAYER = 300
-
-# Labels for the HUD.
-FONTS_PATH = os.path.join(ASSETS_PATH, "fonts")
-FONT_FILE_REGULAR = os.path.join(FONTS_PATH, "BitcountPropSingle-Regular.ttf")
-FONT_FILE_BOLD = os.path.join(FONTS_PATH, "BitcountPropSingle-Bold.ttf")
-LABEL_FONT = pygame.font.Font(FONT_FILE_REGULAR, 30)
-BIG_FONT = pygame.font.Font(FONT_FILE_REGULAR, 48)
-MASSIVE_FONT = pygame.font.Font(FONT_FILE_BOLD, 62)
-
-# Load the background music and balloon sound effects.
-pygame.mixer.music.load(os.path.join(AUDIO_PATH, "theme.ogg"))
-AUDIO_POP = pygame.mixer.Sound(os.path.join(AUDIO_PATH, "pop.ogg"))
-AUDIO_FIRE = pygame.mixer.Sound(os.path.join(AUDIO_PATH, "fire.ogg"))
-AUDIO_OW = pygame.mixer.Sound(os.path.join(AUDIO_PATH, "ow.ogg"))
-AUDIO_LEVEL = pygame.mixer.Sound(os.path.join(AUDIO_PATH, "level.ogg"))
-AUDIO_APPLAUSE = pygame.mixer.Sound(os.path.join(AUDIO_PATH, "applause.ogg"))
-
-# Miscellaneous constants.
-TOTAL_BALLOONS = 100
-BALLOON_BOUNDS = {'min_x':0, 'max_x': SCREEN_WIDTH, 'min_y': 0, 'max_y': STAGE_HEIGHT}
-# Background image for each level.
-BACKGROUND_IMAGES = []
-for i in range(1, 11):
-    BACKGROUND_IMAGES.append(pygame.image.load(os.path.join(IMAGES_PATH, f"background_{i}.jpg")))
+def init_display():
+    """
+    Initialise pygame, open the window and return its surface.
+    """
+    audio.pre_init()
+    pygame.init()
+    surface = pygame.display.set_mode((SCREEN_WIDTH,SCREEN_HEIGHT))
+    pygame.display.set_caption("SuperPang!")
+    # Now that the window exists, prepare the images for fast blitting.
+    convert_images()
+    return surface
 
 class SuperPang:
     """
-    The game class.
+    The game class. The rules of the game are in Simulation, this class
+    handles input, drawing and sound.
     """
-    def __init__(self, god_mode=False, fps=FPS):
+    def __init__(self, god_mode=False, fps=FPS, dirty_rects=False, pixel_collision=False,
+                 record_path=None, swept_collision=False, profile=False, trace_path=None):
         """
-        Initialise the game.
+        Initialise the game. The game is always simulated at FPS ticks a
+        second, and fps is the most frames a second that are drawn. If
+        dirty_rects is True, only the parts of the screen that change are
+        redrawn on each frame. If pixel_collision is True, collisions are
+        tested against the sprites' masks, and if swept_collision is True,
+        arrows hit balloons that pass through them between ticks. If
+        record_path is given, each game is recorded to that file, with the
+        number of the game added to the name after the first. If profile is
+        True, the time taken by each phase of a frame is shown over the
+        stage, and if trace_path is given the times of the last frames are
+        saved to that file, as CSV if it ends with .csv or otherwise JSON,
+        at the end of each game.
         """
         self.god_mode = god_mode
         self.fps = fps
+        self.dirty_rects = dirty_rects
+        self.pixel_collision = pixel_collision
+        self.swept_collision = swept_collision
+        self.record_path = record_path
+        self.trace_path = trace_path
+        self.games = 0 # The number of games started.
+        self.started = time.perf_counter()
+        self.startup_ms = None # Time taken to show the first frame.
+        self.surface = init_display()
+        self.clock = pygame.time.Clock()
+        self.audio = SoundManager()
+        if self.audio.enabled:
+            assets.load_music() # Streamed as it plays, so quick to load.
+        # Fonts for the labels.
+        self.label_font = assets.font("regular", 30)
+        self.big_font = assets.font("regular", 48)
+        self.massive_font = assets.font("bold", 62)
+        # Rendered labels.
+        self.text_cache = TextCache()
+        self.hud = Hud(HUD_RECT, self.label_font, self.text_cache)
+        self.backgrounds = Backgrounds()
+        # Timers for the display, which keep running while the game is paused.
+        self.frame_timers = Scheduler()
+        self.interpolator = Interpolator()
+        self.profiler = Profiler() if profile or trace_path else NULL_PROFILER
+        self.overlay = Overlay(self.profiler, assets.font("regular", 14)) if profile else None
+        self.sim = None
         self.set_up()
 
     def set_up(self):
         """Repeatable set up at the beginning of a game."""
-        px, py = SCREEN_WIDTH / 2, STAGE_HEIGHT-28
-        self.player = Player(initial_x=px, initial_y=py, min_x=0, max_x=SCREEN_WIDTH)
-        self.player_group = pygame.sprite.GroupSingle(self.player)
-        self.make_freezer = True # whether the next balloon should be a freezer.
-        b1 = self.fresh_balloon(level_balloon=False)
-        # Create sprites collections
-        self.balloons = pygame.sprite.Group()
-        self.balloons.add(b1)
-        # there's only ever one arrow on screen right now, but keeping the
-        # group in case I add powerups.
-        self.arrows = pygame.sprite.Group()
-        self.all_sprites = pygame.sprite.Group()
-        self.all_sprites.add(b1)
-        self.all_sprites.add(self.player)
-        self.is_firing = False # Whether the player is currently firing.
-        self.frozen_balloons = False # Whether the balloons are frozen.
-        self.frozen_all = False # Whether all sprites are frozen. 
-        # ten seconds from first balloon to second one, the interval decreases after that.
-        self.balloon_interval = INTERVAL_FRESH_BALLOON
-        # Set the event to add the next balloon.
-        pygame.time.set_timer(EVENT_ADD_BALLOON, self.balloon_interval)
-        self.popped_count = 0
-
-    def fresh_balloon(self, level_balloon=False):
-        """ Make a new, full-size balloon. It appears in either the upper-right or
-        upper-left corner. Every other balloon is a freezer, which means that
-        one of its size 1 balloons will create a short freeze event when popped.
-        If level_balloon is True, create a special balloon that
-        either clears the screen or creates a long freeze event when popped.
-        """
-        self.make_freezer = not self.make_freezer
-        x_dir = random.choice([-1, 1]) # Random left or right
-        initial_x = 0 if x_dir == 1 else SCREEN_WIDTH - 40
-        initial_y, initial_vy = 0, 0
-        pygame.time.set_timer(EVENT_FRESH_BALLOON_WAIT, INTERVAL_FRESH_BALLOON_WAIT)
-        return Balloon(size=5,
-                       initial_x=initial_x,
-                       initial_y=initial_y,
-                       x_dir=x_dir,
-                       vy=initial_vy,
-                       bounds=BALLOON_BOUNDS,
-                       level_balloon=level_balloon,
-                       freezer=self.make_freezer)
-
-    def explode_balloons(self):
-        """ Freeze balloons and explode them on a timer."""
-        self.frozen_balloons = True
-        pygame.time.set_timer(EVENT_EXPLODE, INTERVAL_EXPLODE)
-
-    def explode_one_level(self):
-        """
-        Handle the explosion of balloons.
-        """
-        # Pop all balloons, replacing the ones whose size is greater
-        # than one with two children.
-        if len(self.balloons) > 0:
-            new_balloons = []
-            added_children = False
-            for b in self.balloons:
-                if not b.waiting:
-                    if b.size > 1:
-                        vy = -INITIAL_SPEED_Y / 2
-                        size = b.size - 1
-                        initial_y = b.rect.centery
-                        offset = (b.rect.centerx - b.rect.left) / 2 
-                        c1 = Balloon(size=size,
-                                     initial_x=b.rect.centerx - offset,
-                                     initial_y=initial_y,
-                                     x_dir=-1,
-                                     vy=vy,
-                                     bounds=BALLOON_BOUNDS)
-                        c2 = Balloon(size=size,
-                                     initial_x=b.rect.centerx + offset,
-                                     initial_y=initial_y,
-                                     x_dir=1,
-                                     vy=vy,
-                                     bounds=BALLOON_BOUNDS)
-                        new_balloons.append(c1)
-                        new_balloons.append(c2)
-                        added_children = True
-                    b.kill()
-                    pygame.mixer.Sound.play(AUDIO_POP)
-                    self.popped_count += 1
-            for b in new_balloons:
-                self.balloons.add(b)
-                self.all_sprites.add(b)
-            if not added_children:
-                # There may still be balloons in the group but they are waiting.
-                self.frozen_balloons = False
-                pygame.time.set_timer(EVENT_EXPLODE, 0)
+        if self.sim is None:
+            self.sim = Simulation(god_mode=self.god_mode,
+                                  fps=FPS,
+                                  pixel_collision=self.pixel_collision,
+                                  swept_collision=self.swept_collision)
+            self.sim.profiler = self.profiler
         else:
-            # We have popped all of the balloons, unfreeze and clear
-            # the timer. 
-            self.frozen_balloons = False
-            pygame.time.set_timer(EVENT_EXPLODE, 0)
+            # Reuse the last game's simulation.
+            self.sim.reset()
+        self.games += 1
+        self.recording = Recording.of(self.sim) if self.record_path else None
+        self.frame_timers.clear()
+        self.interpolator.clear()
+        # What is on the screen, for redrawing only the parts that change.
+        self.drawn_bg = None # The background, or None to redraw everything.
+        self.drawn_rects = [] # The areas covered by sprites.
+        self.drawn_hud = None # The values shown in the HUD.
+
+    def snapshot(self):
+        """
+        Return the complete state of the current game as bytes.
+        """
+        return self.sim.snapshot()
 
-    def freeze_balloons(self, interval):
-        """ Freeze balloons."""
-        self.frozen_balloons = True
-        pygame.time.set_timer(EVENT_UNFREEZE, interval)
+    def restore(self, data):
+        """
+        Return the current game to a state saved by snapshot. A game that is
+        being recorded stops being recorded, since its inputs no longer
+        replay it.
+        """
+        self.sim.restore(data)
+        self.recording = None
+        self.interpolator.clear()
+        self.drawn_bg = None
 
-    def freeze_all(self, interval):
-        """ Freeze all entities."""
-        self.frozen_all = True
-        pygame.time.set_timer(EVENT_UNFREEZE, interval)
+    def run(self):
+        """
+        Run the session, moving between the title screen, the game and the
+        end of game screens until the player quits.
+        """
+        screens = {STATE_TITLE: self.title,
+                   STATE_PLAYING: self.play,
+                   STATE_GAME_OVER: self.game_over,
+                   STATE_WON: self.won}
+        state = STATE_TITLE
+        while state != STATE_QUIT:
+            state = screens[state]()
+        self.backgrounds.close()
+        pygame.quit()
+
+    def title(self):
+        """
+        Show the title screen until the player starts a game, and return
+        the next state.
+        """
+        self.display_title(self.surface)
+        if self.startup_ms is None:
+            self.report_startup()
+        return STATE_PLAYING if self.wait_for_space() else STATE_QUIT
 
     def play(self):
         """
-        The game loop.
+        The game loop. Play the current game until it ends or the player
+        quits, and return the next state. The simulation is stepped as many
+        times as needed to keep up with the time that has passed, and each
+        frame is drawn between the last two ticks.
         """
-        pygame.mixer.music.play(-1) # Play the background music.
-        # Initialize variables to keep track of the score, level etc.
-        balloon_count = 1
-        level = 1
-        playing = True
+        if self.audio.enabled:
+            pygame.mixer.music.play(-1) # Play the background music.
+        sim = self.sim
         paused = False
         paused_label = True
-        lives = NUM_LIVES
-        invincible = False
-        player_visible = True
+        tick_ms = 1000 / sim.fps
+        lag = 0.0 # Time not yet simulated, in ms.
+        fire = False
+        profiler = self.profiler
+        self.clock.tick() # Don't count the time before the game started.
     
-        while playing:
-            # Set background image.
-            bg = BACKGROUND_IMAGES[level-1]
-            SURF.blit(bg, (0, 0))
-        
-            end_of_level = False
-
-            # is there an arrow on screen?
-            firing = len(self.arrows) > 0
-
-            events = pygame.event.get()
-            # Check for pause/unpause before other events.
-            for event in events:
+        while sim.playing:
+            profiler.begin_frame()
+            for event in pygame.event.get():
                 if event.type == pl.QUIT:
-                        pygame.quit()
-                        sys.exit()
+                        self.save_recording()
+                        self.save_trace()
+                        return STATE_QUIT
                 elif event.type == pl.KEYDOWN and event.key == pl.K_SPACE:
                     paused = not paused
                     if not paused:
                         # Clear the timer that flashes the label.
-                        pygame.time.set_timer(EVENT_PAUSE_LABEL_FLASH, 0)
+                        self.frame_timers.cancel(EVENT_PAUSE_LABEL_FLASH)
                     else:
                         # Set the timer.
-                        pygame.time.set_timer(EVENT_PAUSE_LABEL_FLASH,
-                                              INTERVAL_PAUSE_LABEL_FLASH)
-                elif event.type == EVENT_PAUSE_LABEL_FLASH:
+                        self.frame_timers.set_timer(EVENT_PAUSE_LABEL_FLASH,
+                                                    self.frames(INTERVAL_PAUSE_LABEL_FLASH))
+                        fire = False # Drop a click that has not been used yet.
+                elif event.type == pl.MOUSEBUTTONDOWN and not paused:
+                    fire = True # Fire on the next tick.
+            for event in self.frame_timers.advance():
+                if event == EVENT_PAUSE_LABEL_FLASH:
                     # Allow the "PAUSED" label to flash.
                     paused_label = not paused_label
-                    
+            profiler.lap(PHASE_EVENTS)
+
+            frame_ms = self.clock.tick(self.fps)
+            profiler.lap(PHASE_WAIT)
+            ticks = 0 # Ticks simulated in this frame.
             if not paused:
-                # Handle events.
-                for event in events:          
-                    if event.type == pl.MOUSEBUTTONDOWN and not firing:
-                        firing = True
-                        self.player.firing(is_firing=firing)
-                        self.fire_arrow()
-                        pygame.mixer.Sound.play(AUDIO_FIRE)
-                    elif event.type == EVENT_ADD_BALLOON:
-                        balloon_count += 1
-                        new_level_target = int(balloon_count / 10) + 1
-                        if new_level_target > 10:
-                            # End of level 10, clear timer
-                            pygame.time.set_timer(EVENT_ADD_BALLOON, 0)
-                        else:
-                            end_of_level = new_level_target > level
-                            b = self.fresh_balloon(level_balloon=end_of_level)
-                            self.balloons.add(b)
-                            self.all_sprites.add(b)
-                            if end_of_level:
-                                # Decrement the time between balloons.
-                                self.balloon_interval = INTERVAL_FRESH_BALLOON - (new_level_target * 100)
-                                pygame.time.set_timer(EVENT_ADD_BALLOON, max(800, self.balloon_interval))
-                    elif event.type == EVENT_EXPLODE:
-                        self.explode_one_level()
-                    elif event.type == EVENT_UNFREEZE:
-                        self.frozen_balloons = False
-                        if self.frozen_all:
-                            # player lost a life, make them invincible for a time
-                            invincible = True
-                            pygame.time.set_timer(EVENT_INVINCIBILITY, INTERVAL_INVINCIBILITY)
-                            self.frozen_all = False
-                    elif event.type == EVENT_FRESH_BALLOON_WAIT:
-                        # Allow new balloons to start moving and be popped.
-                        for b in self.balloons:
-                            b.waiting = False
-                    elif event.type == EVENT_INVINCIBILITY:
-                        invincible = False
-                        player_visible = True
-                        pygame.time.set_timer(EVENT_INVINCIBILITY, 0)
-                        pygame.time.set_timer(EVENT_BLINK_PLAYER, 0)
-                    elif event.type == EVENT_BLINK_PLAYER:
-                        player_visible = not player_visible
-
-                self.move_sprites()
-
-                # Collision detection for player and balloons.
-                if not invincible and not (self.frozen_all or self.frozen_balloons) and not self.god_mode:
-                    if pygame.sprite.spritecollideany(self.player, self.balloons):
-                        pygame.mixer.Sound.play(AUDIO_OW)
-                        if lives < 2:
-                            # end game
-                            lives -= 1
-                            self.display_game_over(SURF)
-                            playing = False
-                        else:
-                            lives -= 1
-                            self.frozen_all = True
-                            pygame.time.set_timer(EVENT_UNFREEZE, INTERVAL_FREEZE_LOST_LIFE)
-                            pygame.time.set_timer(EVENT_BLINK_PLAYER, INTERVAL_BLINK_PLAYER)
-
-                if not self.frozen_all:
-                    # Collision detection for arrows and balloons.
-                    self.collide_arrows_balloons()
-                    # Player won the game.
-                if len(self.balloons) == 0 and balloon_count == TOTAL_BALLOONS:
-                    self.display_won(SURF)
-                    playing = False
-                    
-                new_level = int(balloon_count / 10) + 1
-                if new_level > level and new_level <= 10:
-                    level = new_level
-            else: # is paused
-                if paused_label:
-                    label = MASSIVE_FONT.render("PAUSED", True, WHITE)
-                    label_y = SCREEN_HEIGHT / 2
-                    SURF.blit(label, (250, label_y))
-
-            # Draw all sprites.
-            self.balloons.draw(SURF)
-            self.arrows.draw(SURF)
-            if player_visible:
-                self.player_group.draw(SURF)
-
-            self.draw_hud(SURF, level, lives)
-            
-            # Finalize the frame.
-            pygame.display.update()
-            clock.tick(self.fps)
-        # End of the game, wait to play another or end.
-        play_again_loop = True
-        while play_again_loop:
+                lag += min(frame_ms, MAX_FRAME_MS)
+                pressed_keys = pygame.key.get_pressed()
+                while lag >= tick_ms and sim.playing:
+                    inputs = Inputs(left=pressed_keys[pl.K_LEFT],
+                                    right=pressed_keys[pl.K_RIGHT],
+                                    fire=fire)
+                    fire = False
+                    self.interpolator.save(sim)
+                    sim.step(inputs)
+                    ticks += 1
+                    lag -= tick_ms
+                    if self.recording is not None:
+                        self.recording.record(inputs)
+                    self.audio.cue_all(sim.sounds)
+                self.audio.flush()
+
+            self.draw(self.surface, paused, paused_label, alpha=lag / tick_ms)
+            profiler.end_frame(sim, ticks)
+        # End of the game.
+        self.save_recording()
+        self.save_trace()
+        self.backgrounds.prefetch(1)
+        return STATE_WON if sim.won else STATE_GAME_OVER
+
+    def frames(self, interval):
+        """
+        Convert an interval in ms to a whole number of frames.
+        """
+        return max(1, round(interval * self.fps / 1000))
+
+    def game_over(self):
+        """
+        Show the game over screen until the player starts another game, and
+        return the next state.
+        """
+        self.display_game_over(self.surface)
+        return self.play_again()
+
+    def won(self):
+        """
+        Show the winning screen until the player starts another game, and
+        return the next state.
+        """
+        self.display_won(self.surface)
+        return self.play_again()
+
+    def play_again(self):
+        """
+        Wait for the player to start another game, and return the next state.
+        """
+        if not self.wait_for_space():
+            return STATE_QUIT
+        self.set_up()
+        return STATE_PLAYING
+
+    def wait_for_space(self):
+        """
+        Wait for the space bar to be pressed. Return False if the player
+        quit instead.
+        """
+        while True:
             for event in pygame.event.get():
                 if event.type == pl.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    return False
                 elif event.type == pl.KEYDOWN and event.key == pl.K_SPACE:
-                    play_again_loop = False
-            clock.tick(self.fps)
-        # If we didn't quit, start a new game
-        self.set_up()
-        self.play()
-
-    def move_sprites(self):
-        """ Move the sprites. """
-        if not self.frozen_all and not self.frozen_balloons:
-            # Move the sprites.
-            for entity in self.all_sprites:
-                # entity is not a waiting balloon
-                if not hasattr(entity, 'waiting') or not entity.waiting:
-                    entity.move()
-        elif not self.frozen_all:
-            # Move the player and arrows only.
-            self.player.move()
-            for arrow in self.arrows:
-                arrow.move()
+                    return True
+            self.clock.tick(self.fps)
+
+    def save_recording(self):
+        """
+        Save the recording of the current game, if it is being recorded.
+        """
+        if self.recording is None:
+            return
+        path = self.record_path
+        if self.games > 1:
+            root, ext = os.path.splitext(path)
+            path = f"{root}-{self.games}{ext}"
+        self.recording.finish(self.sim)
+        self.recording.save(path)
+
+    def save_trace(self):
+        """
+        Save the profiler's times for the last frames, if a trace is wanted.
+        """
+        if self.trace_path is not None:
+            self.profiler.save(self.trace_path)
+
+    def report_startup(self):
+        """
+        Note how long it took to show the first frame, with a warning if it
+        took longer than the budget.
+        """
+        self.startup_ms = (time.perf_counter() - self.started) * 1000
+        if self.startup_ms > STARTUP_BUDGET_MS:
+            print(f"Startup took {self.startup_ms:.0f}ms, over the budget of "
+                  f"{STARTUP_BUDGET_MS}ms", file=sys.stderr)
+
+    def draw(self, surface, paused=False, paused_label=False, alpha=1.0):
+        """
+        Draw the current state of the game, redrawing only what has changed
+        if dirty rects are enabled. If alpha is less than 1, the sprites are
+        drawn that fraction of the way from where they were before the last
+        tick to where they are now. The whole screen is redrawn while the
+        profiler's overlay is shown.
+        """
+        self.profiler.mark()
+        # Background image for the level.
+        bg = self.backgrounds.image(self.sim.level)
+        if (self.dirty_rects and not paused and bg is self.drawn_bg
+                and self.overlay is None):
+            self.draw_changes(surface, bg, alpha)
+        else:
+            self.draw_frame(surface, bg, paused and paused_label, alpha)
+            if paused:
+                # Redraw everything after the pause to remove the label.
+                self.drawn_bg = None
+
+    def draw_frame(self, surface, bg, paused_label=False, alpha=1.0):
+        """
+        Redraw the whole screen.
+        """
+        surface.blit(bg, (0, 0))
+        if paused_label:
+            label = self.text_cache.render(self.massive_font, "PAUSED", WHITE)
+            label_y = SCREEN_HEIGHT / 2
+            surface.blit(label, (250, label_y))
+        profiler = self.profiler
+        profiler.lap(PHASE_BACKGROUND)
+        self.drawn_rects = self.draw_sprites(surface, alpha)
+        profiler.lap(PHASE_SPRITES)
+        self.draw_hud(surface, self.sim.level, self.sim.lives)
+        profiler.lap(PHASE_HUD)
+        self.drawn_bg = bg
+        self.drawn_hud = self.hud_values()
+        if self.overlay is not None:
+            self.overlay.draw(surface, self.sim)
+            profiler.mark()
+        pygame.display.update()
+        profiler.lap(PHASE_UPDATE)
+
+    def draw_changes(self, surface, bg, alpha=1.0):
+        """
+        Redraw only the parts of the screen that have changed since the last
+        frame: the areas the sprites covered and now cover, and the HUD if the
+        values it shows have changed.
+        """
+        profiler = self.profiler
+        surface.set_clip(STAGE_RECT)
+        for rect in self.drawn_rects:
+            # Erase the sprite from its old position.
+            surface.blit(bg, rect, rect)
+        surface.set_clip(None)
+        profiler.lap(PHASE_BACKGROUND)
+        rects = self.draw_sprites(surface, alpha)
+        profiler.lap(PHASE_SPRITES)
+        dirty = self.drawn_rects + rects
+        self.drawn_rects = rects
+        hud = self.hud_values()
+        if hud != self.drawn_hud:
+            self.draw_hud(surface, self.sim.level, self.sim.lives)
+            self.drawn_hud = hud
+            dirty.append(HUD_RECT)
+        profiler.lap(PHASE_HUD)
+        pygame.display.update(dirty)
+        profiler.lap(PHASE_UPDATE)
+
+    def draw_sprites(self, surface, alpha=1.0):
+        """
+        Draw the sprites on the stage, alpha of the way from their positions
+        before the last tick, and return the areas they cover.
+        """
+        sim = self.sim
+        if alpha < 1 and self.interpolator.has_saved():
+            blits = self.interpolator.blits(sim, alpha, player=sim.player_visible)
+        else:
+            sprites = sim.balloons.sprites() + sim.arrows.sprites()
+            if sim.player_visible:
+                sprites.append(sim.player)
+            blits = [(s.image, s.rect) for s in sprites]
+        # Keep the sprites off the HUD.
+        surface.set_clip(STAGE_RECT)
+        rects = surface.blits(blits)
+        surface.set_clip(None)
+        return rects
+
+    def hud_values(self):
+        """
+        Return the values shown in the HUD.
+        """
+        return self.sim.level, self.sim.lives, self.sim.popped_count % PROGRESS_BALLOONS
+
+    def display_title(self, surface):
+        """
+        Display the title screen.
+        """
+        surface.blit(self.backgrounds.image(1), (0, 0))
+        title = self.text_cache.render(self.massive_font, "SUPERPANG!", WHITE)
+        start = self.text_cache.render(self.big_font, "Press space to play", WHITE)
+        label_y = SCREEN_HEIGHT / 3
+        surface.blit(title, (230, label_y))
+        surface.blit(start, (170, label_y+80))
+        pygame.display.update()
 
     def display_game_over(self, surface):
         """ Display game over screen. """
         surface.fill(RED)
-        game_over = BIG_FONT.render("GAME OVER!", True, BLACK)
-        play_again = BIG_FONT.render("Press space to play again", True, BLACK)
+        game_over = self.text_cache.render(self.big_font, "GAME OVER!", BLACK)
+        play_again = self.text_cache.render(self.big_font, "Press space to play again", BLACK)
         label_y = SCREEN_HEIGHT / 3
         surface.blit(game_over, (100, label_y))
         surface.blit(play_again, (100, label_y+50))
@@ -371,139 +435,17 @@ class SuperPang:
         Display the message when the player wins the game.
         """
         surface.fill(GOLD)
-        win = BIG_FONT.render("YOU WIN!", True, BLACK)
-        play_again = BIG_FONT.render("Press space to play again", True, BLACK)
+        win = self.text_cache.render(self.big_font, "YOU WIN!", BLACK)
+        play_again = self.text_cache.render(self.big_font, "Press space to play again", BLACK)
         label_y = SCREEN_HEIGHT / 2
         surface.blit(win, (200, label_y))
         surface.blit(play_again, (200, label_y+50))
-        pygame.mixer.Sound.play(AUDIO_APPLAUSE)
+        self.audio.play("applause")
         pygame.display.update()
 
-    def fire_arrow(self):
-        """
-        Add an Arrow sprite.
-        """
-        a_x = self.player.rect.centerx
-        a_y = STAGE_HEIGHT - 20
-        a = Arrow(initial_x=a_x, initial_y=a_y)
-        self.arrows.add(a)
-        self.all_sprites.add(a)
-
     def draw_hud(self, surface, level, lives):
         """ Draw the HUD."""
-        # Draw the ground.
-        pygame.draw.rect(surface,
-                         WHITE,
-                         pygame.Rect(0,
-                                     STAGE_HEIGHT,
-                                     SCREEN_WIDTH,
-                                     SCREEN_HEIGHT-STAGE_HEIGHT))
-        # text
-        rh_pos = (SCREEN_WIDTH-200, STAGE_HEIGHT+5)
-        lh_pos = (10, STAGE_HEIGHT+10)
-        level_text = LABEL_FONT.render(f"Level: {level}", True, BLACK)
-        life_text = LABEL_FONT.render("Lives:", True, BLACK)
-        surface.blit(level_text, lh_pos)
-        surface.blit(life_text, rh_pos)
-        # life icons
-        life_x, life_y = rh_pos
-        life_x += 80
-        for _ in range(lives):
-            surface.blit(IMAGE_PLAYER_LIFE, (life_x, life_y))
-            life_x += 40
-        # progress bar
-        bar_w = 300
-        l,t,h = 230,STAGE_HEIGHT+9,25
-        popped_in_level = self.popped_count % 280
-        progress_w = int((popped_in_level/280)*bar_w)
-        rect_bg = pygame.Rect(l, t, bar_w, h)
-        rect_fg = pygame.Rect(l, t, progress_w, h)
-        pygame.draw.rect(surface=surface,
-                         rect=rect_bg,
-                         color=BLACK,
-                         width=1,
-                         border_radius=5)
-        if progress_w > 294:
-            right_rad = 5
-        else:
-            right_rad = 0
-        pygame.draw.rect(surface=surface,
-                         rect=rect_fg,
-                         color=RED,
-                         border_top_left_radius=5,
-                         border_top_right_radius=right_rad,
-                         border_bottom_left_radius=5,
-                         border_bottom_right_radius=right_rad)      
-    
-    def collide_player(self, surface) -> bool:
-        """
-        Check for a collision between the player and a balloon. Returns True
-        if the game should continue because there was no collision, otherwise False.
-        """
-        if pygame.sprite.spritecollideany(self.player, self.balloons):
-            surface.fill(RED)
-            game_over = BIG_FONT.render("GAME OVER!", True, BLACK)
-            play_again = BIG_FONT.render("Press space to play again", True, BLACK)
-            label_y = SCREEN_HEIGHT / 3
-            surface.blit(game_over, (100, label_y))
-            surface.blit(play_again, (100, label_y+50))
-            pygame.display.update()
-            return False
-        else:
-            return True
-
-    def collide_arrows_balloons(self):
-        """
-        Check for collisions between arrows and balloons. Regular balloons with a size
-        greater than 1 are replaced with two "child" balloons whose size is one less
-        than their parent. Level balloons are either Star balloons, which cause all
-        other balloons to explode, or Clock balloons, which initiate a long freeze.
-        Some size 1 balloons are freezers, which initiate a short freeze.
-        """
-        for b in self.balloons:
-            hit_list = pygame.sprite.spritecollide(b, self.arrows, dokill=True)
-            if len(hit_list) > 0:
-                # If b is a level balloon, explode all other balloons or begin
-                # a long freeze event.
-                if b.level_balloon:
-                    if b.star:
-                        self.explode_balloons()
-                    else:
-                        self.freeze_balloons(INTERVAL_FREEZE_CLOCK)
-                elif b.size > 1 and not b.waiting:
-                    # Replace the balloon with two smaller ones.
-                    vy = 0 if b.rect.top < 20 else -INITIAL_SPEED_Y / 2
-                    size = b.size - 1
-                    initial_y = b.rect.centery
-                    offset = (b.rect.centerx - b.rect.left) / 2 
-                    c1 = Balloon(size=size,
-                                 initial_x=b.rect.centerx - offset,
-                                 initial_y=initial_y,
-                                 x_dir=-1,
-                                 vy=vy,
-                                 bounds=BALLOON_BOUNDS,
-                                 freezer=b.freezer)
-                    c2 = Balloon(size=size,
-                                 initial_x=b.rect.centerx + offset,
-                                 initial_y=initial_y,
-                                 x_dir=1,
-                                 vy=vy,
-                                 bounds=BALLOON_BOUNDS,
-                                 freezer=False)
-                    self.balloons.add(c1, c2)
-                    self.all_sprites.add(c1, c2)
-                elif b.size == 1 and b.freezer:
-                    # The balloon is a size 1 freezer.
-                    self.freeze_balloons(INTERVAL_FREEZE_BALLOON)
-                if not b.waiting:
-                    # For every type of balloon except on which is waiting,
-                    # play the sound effect and remove the balloon.
-                    if b.level_balloon:
-                        pygame.mixer.Sound.play(AUDIO_LEVEL)
-                    else:
-                        pygame.mixer.Sound.play(AUDIO_POP)
-                    b.kill()
-                    self.popped_count += 1
+        self.hud.draw(surface, level, lives, self.sim.popped_count)
 
 if __name__ == '__main__':
     god_mode = False
@@ -511,8 +453,19 @@ if __name__ == '__main__':
     if len(sys.argv) > 1:
         if sys.argv[1] == "GOD_MODE":
             god_mode = True
-    if len(sys.argv) == 4:
+    if len(sys.argv) >= 4:
         if sys.argv[2] == "FPS":
             fps = int(sys.argv[3])
-    game = SuperPang(god_mode, fps)
-    game.play()
+    dirty_rects = "DIRTY_RECTS" in sys.argv
+    pixel_collision = "PIXEL_COLLISION" in sys.argv
+    swept_collision = "SWEPT_COLLISION" in sys.argv
+    record_path = None
+    if "RECORD" in sys.argv[:-1]:
+        record_path = sys.argv[sys.argv.index("RECORD") + 1]
+    profile = "PROFILE" in sys.argv
+    trace_path = None
+    if "TRACE" in sys.argv[:-1]:
+        trace_path = sys.argv[sys.argv.index("TRACE") + 1]
+    game = SuperPang(god_mode, fps, dirty_rects, pixel_collision, record_path,
+                     swept_collision, profile, trace_path)
+    game.run()
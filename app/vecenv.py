@@ -0,0 +1,236 @@
+"""
+Batched environments for training automated players. A VecEnv steps a
+number of independent games in lockstep and returns their observations
+as NumPy arrays, one row per game. A SubprocVecEnv spreads the games over
+worker processes.
+"""
+import multiprocessing
+import random
+import numpy as np
+from simulation import Simulation
+from replay import DECODED_INPUTS, INPUT_LEFT, INPUT_RIGHT, INPUT_FIRE
+
+# Actions are input bytes, as in recordings.
+ACTION_LEFT = INPUT_LEFT
+ACTION_RIGHT = INPUT_RIGHT
+ACTION_FIRE = INPUT_FIRE
+NUM_ACTIONS = 8
+
+# Observation sizes. Balloons after the first MAX_BALLOONS are left out.
+MAX_BALLOONS = 128
+MAX_ARROWS = 1
+BALLOON_FEATURES = 4 # x, y, size, flags
+ARROW_FEATURES = 2 # x, top
+
+# Rewards.
+REWARD_POP = 1.0 # For each balloon popped.
+REWARD_LIFE_LOST = -10.0
+REWARD_WIN = 100.0
+
+# Commands sent to worker processes.
+COMMAND_STEP = "step"
+COMMAND_RESET = "reset"
+COMMAND_CLOSE = "close"
+
+class VecEnv:
+    """
+    A batch of independent games stepped together. Each game that ends is
+    replaced with a new one straight away.
+    """
+    def __init__(self, num_envs, seed=None, god_mode=False, pixel_collision=False,
+                 swept_collision=False, max_ticks=None):
+        """
+        Create num_envs games. seed chooses the seeds of every game played,
+        so that a batch started with the same seed and given the same actions
+        plays out the same way. If max_ticks is given, games are ended after
+        that many ticks.
+        """
+        self.num_envs = num_envs
+        self.god_mode = god_mode
+        self.pixel_collision = pixel_collision
+        self.swept_collision = swept_collision
+        self.max_ticks = max_ticks
+        self.random = random.Random(seed)
+        self.sims = []
+        # The observations, which are overwritten on every step.
+        self.player_x = np.zeros(num_envs, dtype=np.float32)
+        self.balloons = np.zeros((num_envs, MAX_BALLOONS, BALLOON_FEATURES), dtype=np.float32)
+        self.num_balloons = np.zeros(num_envs, dtype=np.int32)
+        self.arrows = np.zeros((num_envs, MAX_ARROWS, ARROW_FEATURES), dtype=np.float32)
+        self.num_arrows = np.zeros(num_envs, dtype=np.int32)
+        self.lives = np.zeros(num_envs, dtype=np.int32)
+        self.level = np.zeros(num_envs, dtype=np.int32)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.reset()
+
+    def new_game(self):
+        """
+        Return a new game.
+        """
+        return Simulation(god_mode=self.god_mode,
+                          seed=self.random.getrandbits(32),
+                          pixel_collision=self.pixel_collision,
+                          swept_collision=self.swept_collision)
+
+    def reset(self):
+        """
+        Start a new game in every environment and return the observations.
+        """
+        self.sims = [self.new_game() for _ in range(self.num_envs)]
+        self.rewards[:] = 0
+        self.dones[:] = False
+        for i, sim in enumerate(self.sims):
+            self.observe(i, sim)
+        return self.observations()
+
+    def step(self, actions):
+        """
+        Advance every game by one tick. actions holds an input byte for each
+        game, made from ACTION_LEFT, ACTION_RIGHT and ACTION_FIRE. Return the
+        observations, the reward for the tick and whether each game ended.
+        The observations of a game that ended are those of its replacement.
+        """
+        for i, action in enumerate(np.asarray(actions, dtype=np.uint8).tolist()):
+            sim = self.sims[i]
+            popped, lives = sim.popped_count, sim.lives
+            sim.step(DECODED_INPUTS[action])
+            reward = (sim.popped_count - popped) * REWARD_POP
+            reward += (lives - sim.lives) * REWARD_LIFE_LOST
+            if sim.won:
+                reward += REWARD_WIN
+            done = not sim.playing or (self.max_ticks is not None and
+                                       sim.tick >= self.max_ticks)
+            if done:
+                sim = self.sims[i] = self.new_game()
+            self.rewards[i] = reward
+            self.dones[i] = done
+            self.observe(i, sim)
+        return self.observations(), self.rewards, self.dones
+
+    def observe(self, i, sim):
+        """
+        Write the observation of game i.
+        """
+        self.player_x[i] = sim.player.rect.centerx
+        self.lives[i] = sim.lives
+        self.level[i] = sim.level
+        store = sim.balloon_store
+        slots = np.flatnonzero(store.alive)
+        slots = slots[np.argsort(store.serial[slots])][:MAX_BALLOONS]
+        n = len(slots)
+        rows = self.balloons[i]
+        rows[:n, 0] = store.x[slots]
+        rows[:n, 1] = store.y[slots]
+        rows[:n, 2] = store.size[slots]
+        rows[:n, 3] = store.flags[slots]
+        rows[n:] = 0
+        self.num_balloons[i] = n
+        rows = self.arrows[i]
+        rows[:] = 0
+        n = 0
+        for arrow in sim.arrows:
+            if n == MAX_ARROWS:
+                break
+            rows[n] = arrow.rect.centerx, arrow.rect.top
+            n += 1
+        self.num_arrows[i] = n
+
+    def observations(self):
+        """
+        Return the observations by name.
+        """
+        return {'player_x': self.player_x,
+                'balloons': self.balloons,
+                'num_balloons': self.num_balloons,
+                'arrows': self.arrows,
+                'num_arrows': self.num_arrows,
+                'lives': self.lives,
+                'level': self.level}
+
+    def close(self):
+        """
+        Nothing to release, for compatibility with SubprocVecEnv.
+        """
+
+def worker(conn, num_envs, seed, kwargs):
+    """
+    Run a VecEnv in a worker process. Each message received over conn is a
+    command and its argument, and the result is sent back.
+    """
+    env = VecEnv(num_envs, seed=seed, **kwargs)
+    while True:
+        command, actions = conn.recv()
+        if command == COMMAND_STEP:
+            conn.send(env.step(actions))
+        elif command == COMMAND_RESET:
+            conn.send(env.reset())
+        else:
+            break
+    conn.close()
+
+class SubprocVecEnv:
+    """
+    A batch of games split evenly over worker processes, which step their
+    share of the games at the same time.
+    """
+    def __init__(self, num_envs, num_workers=None, seed=None, **kwargs):
+        """
+        Create num_envs games over num_workers processes, one per CPU by
+        default. The other arguments are as for VecEnv.
+        """
+        num_workers = min(num_envs, num_workers or multiprocessing.cpu_count())
+        seeds = random.Random(seed)
+        self.num_envs = num_envs
+        # The games run by each worker.
+        self.splits = np.array_split(np.arange(num_envs), num_workers)
+        self.conns = []
+        self.processes = []
+        for split in self.splits:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=worker,
+                                              args=(child, len(split),
+                                                    seeds.getrandbits(32), kwargs),
+                                              daemon=True)
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+
+    def gather(self, parts):
+        """
+        Join the observations from every worker.
+        """
+        return {name: np.concatenate([part[name] for part in parts])
+                for name in parts[0]}
+
+    def reset(self):
+        """
+        Start a new game in every environment and return the observations.
+        """
+        for conn in self.conns:
+            conn.send((COMMAND_RESET, None))
+        return self.gather([conn.recv() for conn in self.conns])
+
+    def step(self, actions):
+        """
+        Advance every game by one tick, as for VecEnv.step.
+        """
+        actions = np.asarray(actions, dtype=np.uint8)
+        for conn, split in zip(self.conns, self.splits):
+            conn.send((COMMAND_STEP, actions[split]))
+        results = [conn.recv() for conn in self.conns]
+        observations = self.gather([obs for obs, _, _ in results])
+        rewards = np.concatenate([rewards for _, rewards, _ in results])
+        dones = np.concatenate([dones for _, _, dones in results])
+        return observations, rewards, dones
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        for conn in self.conns:
+            conn.send((COMMAND_CLOSE, None))
+            conn.close()
+        for process in self.processes:
+            process.join()
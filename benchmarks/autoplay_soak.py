@@ -0,0 +1,255 @@
+"""
+Soak test with the bot. Plays thousands of games headless across every CPU
+core, letting app/autoplay.py choose the inputs, and checks the rules of
+the game on every tick. Every so often it also restores a snapshot of the
+game into a spare one and plays both on with the same inputs, to check that
+snapshots hold the whole state. Reports games that crash, break an
+invariant or get stuck, along with how long each game took:
+
+    $ python benchmarks/autoplay_soak.py --games 1000
+
+Games that fail are saved as recordings, which replay.py can play again.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The game loads its assets relative to the root of the repository.
+os.chdir(ROOT)
+sys.path.insert(0, os.path.join(ROOT, "app"))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+from autoplay import AutoPlayer
+from physics import GRAVITY, INITIAL_SPEED_X, INITIAL_SPEED_Y
+from replay import Recording, state_digest
+from simulation import (Simulation, BALLOON_BOUNDS, NUM_LIVES, EVENT_UNFREEZE, EVENT_EXPLODE,
+                        EVENT_INVINCIBILITY, EVENT_BLINK_PLAYER)
+
+OUTCOME_WON = "won"
+OUTCOME_LOST = "lost"
+OUTCOME_CRASH = "crash"
+OUTCOME_VIOLATION = "violation"
+OUTCOME_STUCK = "stuck"
+FAILURES = [OUTCOME_CRASH, OUTCOME_VIOLATION, OUTCOME_STUCK]
+
+# A moving balloon can be one tick's movement past a wall before it is
+# bounced back.
+WALL_SLACK = INITIAL_SPEED_X
+# Nothing stops balloons rising, so the children of a balloon popped near
+# the top of the stage can go above it by as far as a child rises.
+CEILING_SLACK = sum(INITIAL_SPEED_Y / 2 - GRAVITY * k for k in range(1, 200)
+                    if INITIAL_SPEED_Y / 2 - GRAVITY * k > 0)
+
+def check_invariants(sim):
+    """
+    Return a description of each rule of the game that sim breaks.
+    """
+    problems = []
+    store = sim.balloon_store
+    bounds = BALLOON_BOUNDS
+    slots = np.flatnonzero(store.alive)
+    left = np.trunc(store.x[slots])
+    top = np.trunc(store.y[slots])
+    right = left + store.w[slots]
+    bottom = top + store.h[slots]
+    moving = ~store.waiting[slots]
+    # New balloons wait with their centres in the corners of the stage.
+    centre = (left + right) / 2
+    outside = (((left < bounds['min_x'] - WALL_SLACK) | (right > bounds['max_x'] + WALL_SLACK))
+               & moving)
+    outside |= (centre < bounds['min_x']) | (centre > bounds['max_x'])
+    outside |= (bottom > bounds['max_y']) | (top < bounds['min_y'] - CEILING_SLACK)
+    for slot in slots[outside]:
+        problems.append(f"balloon in slot {slot} is outside the bounds at "
+                        f"({store.x[slot]:.1f}, {store.y[slot]:.1f})")
+    # Every balloon that has been added is either still in play or popped.
+    if store.next_serial - len(sim.balloons) != sim.popped_count:
+        problems.append(f"{store.next_serial} balloons added and {len(sim.balloons)} left, "
+                        f"but {sim.popped_count} popped")
+    if len(slots) != len(sim.balloons):
+        problems.append(f"{len(slots)} slots in use for {len(sim.balloons)} balloons")
+    for b in sim.balloons:
+        if b.slot is None or store.owners[b.slot] is not b:
+            problems.append("a balloon does not own its slot")
+            break
+    expected = set(sim.balloons) | set(sim.arrows) | {sim.player}
+    if set(sim.all_sprites) != expected:
+        problems.append(f"{len(set(sim.all_sprites) ^ expected)} sprites are in all_sprites "
+                        f"or a group but not both")
+    if len(sim.arrows) > 1:
+        problems.append(f"{len(sim.arrows)} arrows on screen")
+    # Every temporary state has a timer to end it.
+    pending = sim.scheduler.pending()
+    if sim.frozen_all and EVENT_UNFREEZE not in pending:
+        problems.append("everything is frozen with no timer to unfreeze it")
+    if sim.frozen_balloons and EVENT_UNFREEZE not in pending and EVENT_EXPLODE not in pending:
+        problems.append("the balloons are frozen with no timer to unfreeze them")
+    if sim.invincible and EVENT_INVINCIBILITY not in pending:
+        problems.append("the player is invincible with no timer to end it")
+    if not sim.player_visible and EVENT_BLINK_PLAYER not in pending:
+        problems.append("the player is hidden with no timer to show it")
+    if not 0 <= sim.lives <= NUM_LIVES:
+        problems.append(f"{sim.lives} lives")
+    if not 1 <= sim.level <= 10:
+        problems.append(f"level {sim.level}")
+    return problems
+
+def check_restored(sim, spare, compare_snapshots):
+    """
+    Return a description of how spare, which was restored from a snapshot
+    of sim and has been given the same inputs since, differs from it.
+    """
+    problems = []
+    if state_digest(spare) != state_digest(sim):
+        problems.append(f"a game restored from a snapshot differs from the original on "
+                        f"tick {sim.tick}")
+    elif compare_snapshots and spare.snapshot() != sim.snapshot():
+        problems.append(f"a game restored from a snapshot has a different snapshot on "
+                        f"tick {sim.tick}")
+    return problems
+
+def play_game(task):
+    """
+    Play the game with the given seed and settings, and return its result.
+    """
+    seed, args = task
+    start = time.perf_counter()
+    sim = None
+    recording = None
+    outcome = None
+    problems = []
+    progress = None # The counters the last time a balloon was added or popped.
+    progress_tick = 0
+    try:
+        sim = Simulation(seed=seed, god_mode=args.god_mode,
+                         pixel_collision=args.pixel_collision,
+                         swept_collision=args.swept_collision)
+        bot = AutoPlayer()
+        recording = Recording.of(sim)
+        # A game restored from a snapshot of sim and played on alongside it.
+        spare = Simulation(god_mode=args.god_mode, pixel_collision=args.pixel_collision,
+                           swept_collision=args.swept_collision)
+        following = 0 # Ticks left to play spare alongside sim.
+        while sim.playing:
+            inputs = bot.inputs(sim)
+            sim.step(inputs)
+            recording.record(inputs)
+            if following:
+                spare.step(inputs)
+                following -= 1
+                problems = check_restored(sim, spare, following == 0)
+            if not problems and args.snapshot_every and sim.tick % args.snapshot_every == 0:
+                spare.restore(sim.snapshot())
+                following = args.snapshot_ticks
+                problems = check_restored(sim, spare, True)
+            if not problems and sim.tick % args.check_every == 0:
+                problems = check_invariants(sim)
+            if problems:
+                outcome = OUTCOME_VIOLATION
+                break
+            if (sim.balloon_count, sim.popped_count) != progress:
+                progress = (sim.balloon_count, sim.popped_count)
+                progress_tick = sim.tick
+            elif sim.tick - progress_tick > args.stuck_ticks:
+                outcome = OUTCOME_STUCK
+                problems = [f"no balloon added or popped for {args.stuck_ticks} ticks"]
+                break
+            if sim.tick >= args.max_ticks:
+                outcome = OUTCOME_STUCK
+                problems = [f"the game did not end in {args.max_ticks} ticks"]
+                break
+        else:
+            outcome = OUTCOME_WON if sim.won else OUTCOME_LOST
+    except Exception:
+        outcome = OUTCOME_CRASH
+        problems = [traceback.format_exc()]
+    # A game that crashed while being set up has no counters to report.
+    result = {'seed': seed,
+              'outcome': outcome,
+              'ticks': sim.tick if sim is not None else 0,
+              'level': sim.level if sim is not None else 0,
+              'lives': sim.lives if sim is not None else 0,
+              'popped': sim.popped_count if sim is not None else 0,
+              'seconds': round(time.perf_counter() - start, 3),
+              'problems': problems}
+    if outcome in FAILURES and args.save_failures and recording is not None:
+        path = os.path.join(args.save_failures, f"{seed}.sprl")
+        recording.finish(sim)
+        recording.save(path)
+        result['recording'] = path
+    return result
+
+def percentile(values, p):
+    """
+    Return the pth percentile of sorted values.
+    """
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000, help="games to play")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="processes to play games in")
+    parser.add_argument("--max-ticks", type=int, default=100000, help="longest game in ticks")
+    parser.add_argument("--stuck-ticks", type=int, default=3000,
+                        help="ticks without a balloon being added or popped before a game "
+                             "counts as stuck")
+    parser.add_argument("--check-every", type=int, default=1,
+                        help="ticks between checks of the invariants")
+    parser.add_argument("--snapshot-every", type=int, default=1000,
+                        help="ticks between snapshots that are restored into a spare game, "
+                             "or 0 for none")
+    parser.add_argument("--snapshot-ticks", type=int, default=100,
+                        help="ticks to play the restored game alongside the original")
+    parser.add_argument("--god-mode", action="store_true")
+    parser.add_argument("--pixel-collision", action="store_true")
+    parser.add_argument("--swept-collision", action="store_true")
+    parser.add_argument("--save-failures", metavar="DIR",
+                        help="save recordings of games that fail in DIR")
+    parser.add_argument("--results", metavar="FILE", help="save the result of every game as JSON")
+    args = parser.parse_args()
+    if args.save_failures:
+        os.makedirs(args.save_failures, exist_ok=True)
+
+    tasks = [(seed, args) for seed in range(args.seed, args.seed + args.games)]
+    results = []
+    counts = dict.fromkeys([OUTCOME_WON, OUTCOME_LOST] + FAILURES, 0)
+    start = time.perf_counter()
+    print(f"Playing {args.games} games in {args.workers} processes")
+    with multiprocessing.Pool(args.workers) as pool:
+        for result in pool.imap_unordered(play_game, tasks):
+            results.append(result)
+            counts[result['outcome']] += 1
+            if result['outcome'] in FAILURES:
+                print(f"seed {result['seed']}: {result['outcome']} on tick {result['ticks']}: "
+                      f"{result['problems'][0].strip()}")
+            if len(results) % 100 == 0:
+                print(f"{len(results)} games, " +
+                      ", ".join(f"{n} {outcome}" for outcome, n in counts.items()))
+    elapsed = time.perf_counter() - start
+
+    seconds = sorted(r['seconds'] for r in results)
+    ticks = sum(r['ticks'] for r in results)
+    print(f"\nPlayed {len(results)} games ({ticks} ticks) in {elapsed:.0f}s, "
+          f"{ticks / elapsed:.0f} ticks a second")
+    print("  " + ", ".join(f"{n} {outcome}" for outcome, n in counts.items()))
+    print(f"  seconds a game: median {percentile(seconds, 50):.1f}, "
+          f"p95 {percentile(seconds, 95):.1f}, max {seconds[-1]:.1f}")
+    slowest = max(results, key=lambda r: r['seconds'])
+    print(f"  slowest: seed {slowest['seed']}, {slowest['ticks']} ticks in {slowest['seconds']:.1f}s")
+    if args.results:
+        with open(args.results, "w") as f:
+            json.dump(sorted(results, key=lambda r: r['seed']), f, indent=1)
+    if any(counts[outcome] for outcome in FAILURES):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Check app/predictor.py against the simulation. Plays games to a random
+point, predicts the balloons from there, then restores a copy of the game
+into a spare simulation and steps it tick by tick without input, comparing
+every balloon's rect with the prediction and the answers of next_crossing
+and earliest_collision with those found in the stepped rects:
+
+    $ python benchmarks/check_predictor.py --games 40
+"""
+import argparse
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The game loads its assets relative to the root of the repository.
+os.chdir(ROOT)
+sys.path.insert(0, os.path.join(ROOT, "app"))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+import pygame
+from predictor import Predictor, first_tick
+from simulation import Simulation, Inputs, NO_INPUT, SCREEN_WIDTH, STAGE_HEIGHT
+
+def stepped_rects(sim, predictor, horizon):
+    """
+    Step a copy of sim for horizon ticks and return the edges of the
+    predicted balloons' rects on each tick, indexed by tick - 1 and balloon,
+    and whether each balloon was still in the game on each tick.
+    """
+    spare = Simulation(god_mode=True, pixel_collision=sim.pixel_collision,
+                       swept_collision=sim.swept_collision)
+    spare.restore(sim.snapshot())
+    store = spare.balloon_store
+    slots = predictor.slots
+    serials = store.serial[slots].copy()
+    shape = (horizon, len(slots))
+    left, top = np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+    alive = np.zeros(shape, dtype=bool)
+    for k in range(horizon):
+        spare.step(NO_INPUT)
+        left[k] = np.trunc(store.x[slots])
+        top[k] = np.trunc(store.y[slots])
+        alive[k] = store.alive[slots] & (store.serial[slots] == serials)
+    return left, top, left + predictor.w, top + predictor.h, alive
+
+def check_state(sim, rng, horizon, queries):
+    """
+    Compare the predictions for sim with the stepped game, and return the
+    number of comparisons and a description of each one that differed.
+    """
+    predictor = Predictor.of(sim)
+    left, top, right, bottom, alive = stepped_rects(sim, predictor, horizon)
+    checked = int(alive.sum())
+    problems = []
+    p_left, p_top, _, _ = predictor.track(horizon)
+    wrong = alive & ((p_left != left) | (p_top != top))
+    for k, i in zip(*np.nonzero(wrong)):
+        problems.append(f"tick {sim.tick}: slot {predictor.slots[i]} predicted at "
+                        f"({p_left[k, i]}, {p_top[k, i]}) in {k + 1} ticks but was at "
+                        f"({left[k, i]}, {top[k, i]})")
+    # The queries can only be compared while every balloon is still there.
+    if not alive.all():
+        return checked, problems
+    for _ in range(queries):
+        x = rng.randrange(-80, SCREEN_WIDTH + 80)
+        below = rng.choice([None, rng.randrange(0, STAGE_HEIGHT)])
+        crossing = (left <= x) & (right > x)
+        if below is not None:
+            crossing &= bottom > below
+        expected = first_tick(crossing)
+        found = predictor.next_crossing(x, below, horizon)
+        checked += 1
+        if not np.array_equal(found, expected):
+            problems.append(f"tick {sim.tick}: next_crossing({x}, {below}) was {found.tolist()} "
+                            f"but should be {expected.tolist()}")
+        rect = pygame.Rect(rng.randrange(-50, SCREEN_WIDTH), rng.randrange(-50, STAGE_HEIGHT),
+                           rng.randrange(1, 200), rng.randrange(1, 200))
+        hits = ((left < rect.right) & (right > rect.left) &
+                (top < rect.bottom) & (bottom > rect.top))
+        ticks = first_tick(hits)
+        ticks = np.where(ticks < 0, horizon + 1, ticks)
+        if len(ticks) and ticks.min() <= horizon:
+            i = int(np.argmin(ticks))
+            expected = (int(ticks[i]), int(predictor.slots[i]))
+        else:
+            expected = (-1, None)
+        found = predictor.earliest_collision(rect, horizon)
+        checked += 1
+        if found != expected:
+            problems.append(f"tick {sim.tick}: earliest_collision({rect}) was {found} "
+                            f"but should be {expected}")
+    return checked, problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=40, help="games to play")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--states", type=int, default=5,
+                        help="points in each game to predict from")
+    parser.add_argument("--horizon", type=int, default=400, help="ticks to predict")
+    parser.add_argument("--queries", type=int, default=20,
+                        help="queries of each kind at each point")
+    args = parser.parse_args()
+
+    checked = 0
+    problems = []
+    for seed in range(args.seed, args.seed + args.games):
+        rng = random.Random(seed)
+        sim = Simulation(seed=seed, god_mode=True, pixel_collision=seed % 3 == 1,
+                         swept_collision=seed % 3 == 2)
+        for _ in range(args.states):
+            for _ in range(rng.randrange(0, 1500)):
+                sim.step(Inputs(left=rng.random() < 0.4, right=rng.random() < 0.4,
+                                fire=rng.random() < 0.15))
+                if not sim.playing:
+                    break
+            if not sim.playing:
+                break
+            n, found = check_state(sim, rng, args.horizon, args.queries)
+            checked += n
+            problems.extend(found)
+    for problem in problems[:20]:
+        print(problem)
+    print(f"Made {checked} comparisons in {args.games} games, {len(problems)} differed")
+    if problems:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Benchmarks for simulation throughput and frame time.
+
+Runs each scenario headless for a number of ticks and reports ticks per
+second, frame time percentiles and allocations per tick. With --render,
+each tick is also drawn with the SDL dummy video driver. The time from
+starting Python to showing the first frame is measured too. Results are
+saved as JSON so that they can be compared between commits:
+
+    $ python benchmarks/run.py
+    $ python benchmarks/run.py --render --compare benchmarks/results/abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The game loads its assets relative to the root of the repository.
+os.chdir(ROOT)
+sys.path.insert(0, os.path.join(ROOT, "app"))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from scenarios import SCENARIOS
+
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results")
+# Allocations are measured over this many ticks, in a separate run.
+ALLOCATION_TICKS = 300
+# Startup is measured this many times, each in a new process.
+STARTUP_RUNS = 5
+# Imports the game, creates it and draws the first frame, printing the
+# time taken since the process started in ms.
+STARTUP_SCRIPT = """
+import sys
+import time
+start = time.perf_counter()
+sys.path.insert(0, "app")
+import superpang
+game = superpang.SuperPang()
+game.draw(game.surface)
+print((time.perf_counter() - start) * 1000)
+"""
+
+def percentile(values, p):
+    """
+    Return the pth percentile of a sorted list of values.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def make_renderer(sim, dirty_rects):
+    """
+    Return a function that draws sim with the game's renderer, and one that
+    closes the renderer once the scenario has finished.
+    """
+    import superpang
+    game = superpang.SuperPang(dirty_rects=dirty_rects)
+    game.sim = sim
+    return (lambda: game.draw(game.surface)), game.backgrounds.close
+
+def run_ticks(scenario, ticks, render, dirty_rects, on_tick=None):
+    """
+    Run the scenario for a number of ticks, calling on_tick(sim, seconds)
+    with the time taken by each tick.
+    """
+    sim, rng = scenario.make()
+    draw, close = make_renderer(sim, dirty_rects) if render else (None, None)
+    clock = time.perf_counter
+    try:
+        for tick in range(ticks):
+            inputs = scenario.inputs(tick)
+            start = clock()
+            sim.step(inputs)
+            if draw is not None:
+                draw()
+            end = clock()
+            if on_tick is not None:
+                on_tick(sim, end - start)
+            if scenario.refill is not None:
+                scenario.refill(sim, rng)
+            if not sim.playing:
+                break
+    finally:
+        if close is not None:
+            close()
+
+def measure_allocations(scenario, ticks, render, dirty_rects):
+    """
+    Return the mean number of bytes allocated during a tick, measured as the
+    peak traced memory above the memory in use when the tick started, and
+    the mean change in the number of allocated memory blocks per tick.
+    """
+    peaks = []
+    blocks = [sys.getallocatedblocks()]
+    def on_tick(sim, seconds):
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - start[0])
+        blocks.append(sys.getallocatedblocks())
+        tracemalloc.reset_peak()
+        start[0] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.start()
+    start = [tracemalloc.get_traced_memory()[0]]
+    try:
+        run_ticks(scenario, ticks, render, dirty_rects, on_tick)
+    finally:
+        tracemalloc.stop()
+    # The first ticks include one-off allocations such as the arrow strip.
+    skip = len(peaks) // 10
+    settled = peaks[skip:]
+    net_blocks = (blocks[-1] - blocks[skip]) / len(settled)
+    return sum(settled) / len(settled), net_blocks
+
+def benchmark(scenario, ticks, render, dirty_rects):
+    """
+    Run one scenario and return its results.
+    """
+    times = []
+    balloons = []
+    def on_tick(sim, seconds):
+        times.append(seconds)
+        balloons.append(len(sim.balloons))
+    start = time.perf_counter()
+    run_ticks(scenario, ticks, render, dirty_rects, on_tick)
+    elapsed = time.perf_counter() - start
+    frame_ms = sorted(t * 1000 for t in times)
+    alloc_bytes, net_blocks = measure_allocations(scenario, min(ticks, ALLOCATION_TICKS),
+                                                  render, dirty_rects)
+    return {
+        "description": scenario.description,
+        "ticks": len(times),
+        "ticks_per_second": len(times) / sum(times),
+        "wall_seconds": elapsed,
+        "frame_ms": {
+            "mean": sum(frame_ms) / len(frame_ms),
+            "p50": percentile(frame_ms, 50),
+            "p95": percentile(frame_ms, 95),
+            "p99": percentile(frame_ms, 99),
+            "max": frame_ms[-1],
+        },
+        "alloc_bytes_per_tick": alloc_bytes,
+        "net_blocks_per_tick": net_blocks,
+        "mean_balloons": sum(balloons) / len(balloons),
+    }
+
+def measure_startup():
+    """
+    Return the median time in ms to import the game, create it and draw the
+    first frame, in a new process so that nothing has been loaded already.
+    """
+    times = []
+    for _ in range(STARTUP_RUNS):
+        result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT],
+                                capture_output=True, text=True, check=True)
+        times.append(float(result.stdout.split()[-1]))
+    return percentile(sorted(times), 50)
+
+def git_commit():
+    """
+    Return the short hash of the current commit, or "unknown".
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results, baseline):
+    """
+    Print the change in throughput and frame time from a baseline.
+    """
+    print(f"\nCompared with {baseline['commit']}:")
+    if "startup_ms" in baseline:
+        startup = results["startup_ms"] / baseline["startup_ms"] - 1
+        print(f"  {'startup':<18} time {startup:+7.1%}")
+    for name, result in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        tps = result["ticks_per_second"] / base["ticks_per_second"] - 1
+        p95 = result["frame_ms"]["p95"] / base["frame_ms"]["p95"] - 1
+        print(f"  {name:<18} ticks/s {tps:+7.1%}   p95 frame time {p95:+7.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ticks", type=int, default=2000, help="ticks per scenario")
+    parser.add_argument("--scenario", action="append",
+                        help="run only the named scenario (may be repeated)")
+    parser.add_argument("--render", action="store_true",
+                        help="draw every tick with the dummy video driver")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="draw with dirty rects (implies --render)")
+    parser.add_argument("--output", help="where to save the results")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    args = parser.parse_args()
+    render = args.render or args.dirty_rects
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "render": render,
+        "dirty_rects": args.dirty_rects,
+        "startup_ms": measure_startup(),
+        "scenarios": {},
+    }
+    print(f"{'startup':<18} {results['startup_ms']:9.0f} ms to the first frame")
+    for scenario in SCENARIOS:
+        if args.scenario and scenario.name not in args.scenario:
+            continue
+        result = benchmark(scenario, args.ticks, render, args.dirty_rects)
+        results["scenarios"][scenario.name] = result
+        frame = result["frame_ms"]
+        print(f"{scenario.name:<18} {result['ticks_per_second']:9.0f} ticks/s  "
+              f"p50 {frame['p50']:.3f}ms  p95 {frame['p95']:.3f}ms  p99 {frame['p99']:.3f}ms  "
+              f"{result['alloc_bytes_per_tick']:8.0f} B/tick  "
+              f"{result['mean_balloons']:5.0f} balloons")
+
+    output = args.output or os.path.join(RESULTS_PATH, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Scripted game scenarios for the benchmarks. Each scenario sets up a
+Simulation and supplies the player's input for every tick.
+"""
+import random
+from simulation import Simulation, Inputs, NO_INPUT, BALLOON_BOUNDS, SCREEN_WIDTH
+from sprites import Balloon
+
+class Scenario:
+    """
+    A named game setup with scripted inputs.
+    """
+    def __init__(self, name, description, setup=None, inputs=None, refill=None):
+        """
+        Create a scenario. setup(sim, rng) prepares a new simulation,
+        inputs(tick) returns the input for a tick and refill(sim, rng) is
+        called after every tick to keep the scenario going.
+        """
+        self.name = name
+        self.description = description
+        self.setup = setup
+        self.inputs = inputs or (lambda tick: NO_INPUT)
+        self.refill = refill
+
+    def make(self, seed=0):
+        """
+        Return a new simulation set up for the scenario, and the random
+        number generator used by the scenario.
+        """
+        # God mode keeps the game going for as long as the benchmark runs.
+        sim = Simulation(god_mode=True, seed=seed)
+        rng = random.Random(seed)
+        if self.setup is not None:
+            self.setup(sim, rng)
+        return sim, rng
+
+def add_balloon(sim, size, x, y, x_dir, vy=0, waiting=False):
+    """
+    Add a balloon to the simulation.
+    """
+    b = Balloon.create(size=size,
+                       initial_x=x,
+                       initial_y=y,
+                       x_dir=x_dir,
+                       vy=vy,
+                       bounds=BALLOON_BOUNDS,
+                       store=sim.balloon_store)
+    b.waiting = waiting
+    sim.balloons.add(b)
+    sim.all_sprites.add(b)
+    return b
+
+def add_random_balloons(sim, rng, count, sizes):
+    """
+    Add count moving balloons, with sizes chosen from sizes, at random
+    positions on the stage.
+    """
+    for _ in range(count):
+        add_balloon(sim,
+                    size=rng.choice(sizes),
+                    x=rng.uniform(60, SCREEN_WIDTH - 60),
+                    y=rng.uniform(60, 300),
+                    x_dir=rng.choice([-1, 1]),
+                    vy=rng.uniform(-10, 0))
+
+def sweep_and_fire(tick):
+    """
+    Walk back and forth across the stage, firing whenever possible.
+    """
+    left = (tick // 90) % 2 == 0
+    return Inputs(left=left, right=not left, fire=True)
+
+def late_level_setup(sim, rng):
+    """
+    Start on level 9 with hundreds of balloons on the stage.
+    """
+    sim.balloon_count = 81
+    sim.level = 9
+    add_random_balloons(sim, rng, 300, sizes=[1, 2, 3, 4])
+
+def late_level_refill(sim, rng):
+    """
+    Keep the stage crowded as balloons are popped.
+    """
+    if len(sim.balloons) < 200:
+        add_random_balloons(sim, rng, 100, sizes=[1, 2, 3, 4])
+
+def cascade_setup(sim, rng):
+    """
+    Fill the stage with full size balloons and pop a star balloon.
+    """
+    add_random_balloons(sim, rng, 40, sizes=[5])
+    sim.explode_balloons()
+
+def cascade_refill(sim, rng):
+    """
+    Start another cascade when the last one has finished.
+    """
+    if not sim.frozen_balloons:
+        cascade_setup(sim, rng)
+
+SCENARIOS = [
+    Scenario("level1_single",
+             "Level 1 with a single balloon and no input."),
+    Scenario("late_level_split",
+             "Level 9 with 200-400 split balloons while the player fires.",
+             setup=late_level_setup,
+             inputs=sweep_and_fire,
+             refill=late_level_refill),
+    Scenario("star_cascade",
+             "Repeated explode_one_level cascades from 40 full size balloons.",
+             setup=cascade_setup,
+             refill=cascade_refill),
+    Scenario("continuous_fire",
+             "Level 1 with the player walking and firing on every tick.",
+             inputs=sweep_and_fire),
+]
@@ -0,0 +1,139 @@
+"""
+Soak test for long sessions. Plays thousands of consecutive games headless
+in one SuperPang session, driving SuperPang.run() with a scripted clock and
+keyboard so that every game goes through the title, playing and end of game
+screens as it would for a player, and reports the memory in use as it goes.
+Memory should stay flat however many games are played:
+
+    $ python benchmarks/soak.py --games 5000
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The game loads its assets relative to the root of the repository.
+os.chdir(ROOT)
+sys.path.insert(0, os.path.join(ROOT, "app"))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import pygame.locals as pl
+import superpang
+from simulation import FPS
+
+# Games played before the baseline memory is taken, while caches fill.
+WARM_UP_GAMES = 20
+
+class ScriptedPlayer:
+    """
+    Stands in for the clock and keyboard of a session. Every frame takes one
+    tick's worth of time without waiting, the arrow keys and mouse button are
+    pressed at random while a game is being played, and the space bar is
+    pressed on the screens between games until enough have been played.
+    """
+    def __init__(self, game, rng, games, max_ticks, on_game_end):
+        """
+        Play games in game with random input from rng, cutting them short
+        after max_ticks, and call on_game_end with the number played after
+        each one.
+        """
+        self.game = game
+        self.rng = rng
+        self.games = games
+        self.max_ticks = max_ticks
+        self.on_game_end = on_game_end
+        self.played = 0
+        self.ended = None # The game whose end was last counted.
+        self.keys = {pl.K_LEFT: False, pl.K_RIGHT: False}
+
+    def tick(self, fps=0):
+        """
+        Take the place of Clock.tick, choosing the input for the next frame,
+        and return the length of a tick in ms.
+        """
+        sim = self.game.sim
+        rng = self.rng
+        if sim.playing:
+            if sim.tick >= self.max_ticks:
+                sim.playing = False # Cut the game short, as if it was lost.
+            self.keys[pl.K_LEFT] = rng.random() < 0.4
+            self.keys[pl.K_RIGHT] = rng.random() < 0.4
+            if rng.random() < 0.1:
+                pygame.event.post(pygame.event.Event(pl.MOUSEBUTTONDOWN, button=1, pos=(0, 0)))
+        elif self.ended != self.game.games:
+            # On the screen at the end of a game.
+            self.ended = self.game.games
+            self.played += 1
+            self.on_game_end(self.played)
+            if self.played < self.games:
+                pygame.event.post(pygame.event.Event(pl.KEYDOWN, key=pl.K_SPACE))
+            else:
+                pygame.event.post(pygame.event.Event(pl.QUIT))
+        return 1000 / FPS
+
+    def get_pressed(self):
+        """
+        Take the place of pygame.key.get_pressed.
+        """
+        return self.keys
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000, help="games to play")
+    parser.add_argument("--max-ticks", type=int, default=20000, help="longest game in ticks")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="redraw only the parts of the screen that change")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every frame and show the overlay")
+    parser.add_argument("--report", type=int, default=100,
+                        help="games between reports")
+    parser.add_argument("--max-growth-kb", type=float, default=256,
+                        help="fail if traced memory grows by more than this")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Seeds for new games are chosen with the random module.
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    game = superpang.SuperPang(dirty_rects=args.dirty_rects, profile=args.profile)
+    baseline = None
+    traced = 0.0
+    ticks = 0
+    def game_end(played):
+        nonlocal baseline, traced, ticks
+        ticks += game.sim.tick
+        traced = tracemalloc.get_traced_memory()[0] / 1024
+        if played == WARM_UP_GAMES:
+            baseline = traced
+        if played % args.report == 0 or played == args.games:
+            growth = traced - baseline if baseline is not None else 0.0
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{played:>7} {ticks:>10} {traced:>10.0f} {growth:>10.1f} {max_rss:>10.1f}")
+    player = ScriptedPlayer(game, rng, args.games, args.max_ticks, game_end)
+    game.clock = player
+    pygame.key.get_pressed = player.get_pressed
+    tracemalloc.start()
+    start = time.perf_counter()
+    print(f"{'games':>7} {'ticks':>10} {'traced KB':>10} {'growth KB':>10} {'max RSS MB':>10}")
+    # Start the first game from the title screen.
+    pygame.event.post(pygame.event.Event(pl.KEYDOWN, key=pl.K_SPACE))
+    game.run()
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+    growth = traced - baseline if baseline is not None else 0.0
+    print(f"Played {player.played} games ({ticks} ticks) in {elapsed:.0f}s, "
+          f"traced memory grew by {growth:.1f}KB")
+    if growth > args.max_growth_kb:
+        print(f"Memory grew by more than {args.max_growth_kb}KB", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()